@@ -19,15 +19,16 @@ def main():
     # "identifier" conflicts w/ both "struct" and "entity", so it is excracted into separate tokenizer
     identifier_tokenizer.add_lexer(tired.parse.GenericRegexLexer("identifier", r'[a-zA-Z0-9]+', ))
     state = 0
+    position = 0
 
-    while len(content):
+    while position < len(content):
         try:
             # Get token
-            #print("CONTEXT", content[:100])
+            #print("CONTEXT", content[position:position + 100])
             if state == 4:
-                token = identifier_tokenizer.tokenize(content)
+                token = identifier_tokenizer.tokenize(content, pos=position)
             else:
-                token = preamble_tokenizer.tokenize(content)
+                token = preamble_tokenizer.tokenize(content, pos=position)
 
             if token.lexer_identifier == 'template' and state == 0:
                 state = 1
@@ -43,8 +44,8 @@ def main():
             else:
                 state = 0
 
-            # Cut the content
-            content = token.get_string_remainder(content)
+            # Move past the token, w/o copying the rest of the content
+            position = token.end_position
 
             print('-----')
         except StopIteration:
@@ -0,0 +1,62 @@
+"""
+Walks all the nested brace-enclosed chunks (each next one is looked for
+right after the start of the previous one) w/ `SingleBracePairBalanceLexer`s
+for "<>", "{}" and "()" on `res/Callable.hpp` repeated `N_REPEATS` times:
+each lexer w/ its own `BracketMatchIndex`, and all of them sharing one.
+
+Usage: parse_benchmark_brace_lexer.py [N_REPEATS]
+"""
+
+import pathlib
+import sys
+import time
+import tired.parse
+
+
+PAIRS = [('<', '>'), ('{', '}'), ('(', ')')]
+
+
+def make_tokenizer(match_index=None):
+    tokenizer = tired.parse.Tokenizer()
+
+    for lbrace, rbrace in PAIRS:
+        tokenizer.add_lexer(tired.parse.SingleBracePairBalanceLexer(lbrace + rbrace, lbrace, rbrace, match_index))
+
+    return tokenizer
+
+
+def walk_nested(tokenizer, content):
+    tokens = list()
+    position = 0
+
+    while True:
+        try:
+            token = tokenizer.tokenize(content, pos=position)
+        except StopIteration:
+            return tokens
+
+        tokens.append(token)
+        position = token.start_position + 1
+
+
+def measure(name, tokenizer, content):
+    time_start = time.perf_counter()
+    tokens = walk_nested(tokenizer, content)
+    duration = time.perf_counter() - time_start
+    print(f"{name:<10} {duration * 1000:10.1f} ms, {len(tokens)} tokens")
+
+
+def main():
+    n_repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    path = pathlib.Path(__file__).resolve().parent / 'res' / 'Callable.hpp'
+
+    with open(path, 'r') as f:
+        content = f.read() * n_repeats
+
+    print(f"{len(content)} characters")
+    measure("separate", make_tokenizer(), content)
+    measure("shared", make_tokenizer(tired.parse.BracketMatchIndex(PAIRS)), content)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Compares reading a generated log file into memory against the file
+sources of `tired.parse`: splitting it into lines (`iterate_string_multiline`
+vs `iterate_file_multiline`), and tokenizing it (`CompiledTokenizer` over
+the whole content vs `iter_file_tokens`). Reports time, and peak memory
+traced by `tracemalloc` (in a separate run, as tracing slows allocations
+down).
+
+Usage: parse_benchmark_file_sources.py [SIZE_MB]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import tired.parse
+
+
+def write_log(path, size):
+    line = b"2024-01-01 00:00:00 I [worker 42] -> processed 1000 items in 12 ms\n"
+
+    with open(path, 'wb') as f:
+        for _ in range(size // (len(line) * 1000)):
+            f.write(line * 1000)
+
+
+def make_tokenizer():
+    tokenizer = tired.parse.CompiledTokenizer()
+    tokenizer.add_lexer(tired.parse.GenericRegexLexer("identifier", rb'[a-zA-Z_][a-zA-Z0-9_]*'))
+    tokenizer.add_lexer(tired.parse.GenericRegexLexer("number", rb'[0-9]+'))
+    tokenizer.add_lexer(tired.parse.GenericRegexLexer("punctuation", rb'->|[^\sa-zA-Z0-9_]'))
+
+    return tokenizer
+
+
+def count_lines_read(path):
+    with open(path, 'r') as f:
+        return sum(1 for _ in tired.parse.iterate_string_multiline(f.read()))
+
+
+def count_lines_mapped(path):
+    return sum(1 for _ in tired.parse.iterate_file_multiline(path))
+
+
+def count_tokens_read(path):
+    with open(path, 'rb') as f:
+        return sum(1 for _ in make_tokenizer().iter_tokens(f.read()))
+
+
+def count_tokens_chunked(path):
+    return sum(1 for _ in tired.parse.iter_file_tokens(make_tokenizer(), path))
+
+
+def measure(name, count, path):
+    time_start = time.perf_counter()
+    n = count(path)
+    duration = time.perf_counter() - time_start
+    tracemalloc.start()
+    count(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<16} {n:10} items, {duration * 1000:8.1f} ms, peak {peak / 2 ** 20:8.1f} MiB")
+
+
+def main():
+    size = int(sys.argv[1]) * 2 ** 20 if len(sys.argv) > 1 else 5 * 2 ** 20
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "log.txt")
+        write_log(path, size)
+
+        measure("lines, read", count_lines_read, path)
+        measure("lines, mapped", count_lines_mapped, path)
+        measure("tokens, read", count_tokens_read, path)
+        measure("tokens, chunked", count_tokens_chunked, path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compares re-tokenizing the whole text after each small random edit
+(replacements, inserts, and deletes) against `IncrementalTokenStore.edit`,
+on `res/Callable.hpp` repeated `N_REPEATS` times.
+
+Usage: parse_benchmark_incremental.py [N_REPEATS] [N_EDITS]
+"""
+
+import pathlib
+import random
+import sys
+import time
+import tired.parse
+
+
+def make_tokenizer():
+    tokenizer = tired.parse.CompiledTokenizer()
+    tokenizer.add_lexer(tired.parse.GenericRegexLexer("identifier", r'[a-zA-Z_][a-zA-Z0-9_]*'))
+    tokenizer.add_lexer(tired.parse.GenericRegexLexer("number", r'[0-9]+'))
+    tokenizer.add_lexer(tired.parse.GenericRegexLexer("punctuation", r'[^\sa-zA-Z0-9_]'))
+
+    return tokenizer
+
+
+def generate_edits_iter(text_length, n_edits):
+    random.seed(0)
+
+    for _ in range(n_edits):
+        start = random.randint(0, text_length - 8)
+        kind = random.choice(["replace", "insert", "delete"])
+        end = start if kind == "insert" else start + 4
+        replacement = '' if kind == "delete" else ''.join(random.choice("ab1 +\n") for _ in range(random.randint(1, 4)))
+        yield start, end, replacement
+        text_length += len(replacement) - (end - start)
+
+
+def main():
+    n_repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_edits = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    path = pathlib.Path(__file__).resolve().parent / 'res' / 'Callable.hpp'
+
+    with open(path, 'r') as f:
+        original_text = f.read() * n_repeats
+
+    text = original_text
+    tokenizer = make_tokenizer()
+    time_start = time.perf_counter()
+
+    for start, end, replacement in generate_edits_iter(len(text), n_edits):
+        text = text[:start] + replacement + text[end:]
+        tokens = list(tokenizer.iter_tokens(text))
+
+    full_duration = (time.perf_counter() - time_start) / n_edits
+    store = tired.parse.IncrementalTokenStore(make_tokenizer(), original_text)
+    time_start = time.perf_counter()
+    n_relexed = 0
+
+    for start, end, replacement in generate_edits_iter(len(original_text), n_edits):
+        n_relexed += store.edit(start, end, replacement)[2]
+
+    incremental_duration = (time.perf_counter() - time_start) / n_edits
+    assert [(i.start_position, i.chunk) for i in tokens] == [(i.start_position, i.chunk) for i in store.get_tokens()]
+
+    print(f"{len(text)} characters, {len(tokens)} tokens")
+    print(f"full:        {full_duration * 1000:8.2f} ms per edit")
+    print(f"incremental: {incremental_duration * 1000:8.2f} ms per edit, {n_relexed / n_edits:.1f} tokens re-lexed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares `Tokenizer`, driven by slicing off the remainder after each token,
+against `CompiledTokenizer.iter_tokens` on `res/Callable.hpp` repeated
+`N_REPEATS` times.
+
+Usage: parse_benchmark_tokenizer.py [N_REPEATS]
+"""
+
+import pathlib
+import sys
+import time
+import tired.parse
+
+
+def add_lexers(tokenizer):
+    tokenizer.add_lexer(tired.parse.GenericRegexLexer("identifier", r'[a-zA-Z_][a-zA-Z0-9_]*'))
+    tokenizer.add_lexer(tired.parse.GenericRegexLexer("number", r'[0-9]+'))
+    tokenizer.add_lexer(tired.parse.GenericRegexLexer("arrow", r'->'))
+    tokenizer.add_lexer(tired.parse.GenericRegexLexer("punctuation", r'[^\sa-zA-Z0-9_]'))
+
+    return tokenizer
+
+
+def tokenize_sliced(content):
+    tokenizer = add_lexers(tired.parse.Tokenizer())
+    tokens = list()
+
+    while True:
+        try:
+            token = tokenizer.tokenize(content)
+        except StopIteration:
+            break
+
+        tokens.append((token.lexer_identifier, token.chunk))
+        content = token.get_string_remainder(content)
+
+    return tokens
+
+
+def tokenize_compiled(content):
+    tokenizer = add_lexers(tired.parse.CompiledTokenizer())
+
+    return [(i.lexer_identifier, i.chunk) for i in tokenizer.iter_tokens(content)]
+
+
+def measure(name, tokenize, content):
+    time_start = time.perf_counter()
+    tokens = tokenize(content)
+    duration = time.perf_counter() - time_start
+    print(f"{name:<10} {duration * 1000:10.1f} ms, {len(tokens) / duration:10.0f} tokens/s")
+
+    return tokens
+
+
+def main():
+    n_repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    path = pathlib.Path(__file__).resolve().parent / 'res' / 'Callable.hpp'
+
+    with open(path, 'r') as f:
+        content = f.read() * n_repeats
+
+    print(f"{len(content)} characters")
+    tokens = measure("sliced", tokenize_sliced, content)
+    assert tokens == measure("compiled", tokenize_compiled, content)
+
+
+if __name__ == "__main__":
+    main()
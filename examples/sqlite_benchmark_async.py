@@ -0,0 +1,103 @@
+"""
+Measures event loop latency (how late a 1 ms timer fires) during bursts of
+inserts, when they are run by a blocking `Db`, and by `AsyncDb`.
+
+Usage: sqlite_benchmark_async.py [N_BURSTS] [BURST_SIZE]
+"""
+
+import asyncio
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+import tired.logging
+import tired.sqlite
+
+
+def make_schema():
+    quantity = tired.sqlite.InfoField("quantity", int)
+    table = tired.sqlite.Table("item")
+    table.add_field(quantity)
+
+    generate_db = tired.sqlite.GenerateDbScript()
+    generate_db.add_table(table)
+
+    return generate_db, table, quantity
+
+
+def make_insert(table, quantity, i):
+    insert = tired.sqlite.InsertQuery(table)
+    insert.add_value(quantity, i)
+
+    return insert
+
+
+async def measure_lag(lags, is_running):
+    while is_running():
+        time_start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - time_start - 0.001)
+
+
+async def run_blocking(path, n_bursts, burst_size):
+    generate_db, table, quantity = make_schema()
+    db = tired.sqlite.Db([table])
+    db.connect(path, profile="durable")
+    db.execute_script(generate_db)
+    lags = list()
+    is_running = True
+    ticker = asyncio.create_task(measure_lag(lags, lambda: is_running))
+
+    for burst in range(n_bursts):
+        for i in range(burst_size):
+            db.execute(make_insert(table, quantity, i))
+
+        await asyncio.sleep(0.05)
+
+    is_running = False
+    await ticker
+    db.close()
+
+    return lags
+
+
+async def run_async(path, n_bursts, burst_size):
+    generate_db, table, quantity = make_schema()
+    db = tired.sqlite.AsyncDb([table])
+    await db.connect(path, profile="durable")
+    await db.execute_script(generate_db)
+    lags = list()
+    is_running = True
+    ticker = asyncio.create_task(measure_lag(lags, lambda: is_running))
+
+    for burst in range(n_bursts):
+        await asyncio.gather(*[db.execute(make_insert(table, quantity, i)) for i in range(burst_size)])
+        await asyncio.sleep(0.05)
+
+    is_running = False
+    await ticker
+    await db.close()
+
+    return lags
+
+
+def main():
+    n_bursts = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    burst_size = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    tired.logging.set_level(tired.logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, run in [("Db", run_blocking), ("AsyncDb", run_async)]:
+            path = str(pathlib.Path(directory) / f"{name}.db")
+            time_start = time.perf_counter()
+            lags = asyncio.run(run(path, n_bursts, burst_size))
+            duration = time.perf_counter() - time_start
+            p99 = statistics.quantiles(lags, n=100)[98] if len(lags) > 1 else lags[0]
+            print(f"{name:8} {n_bursts * burst_size / duration:10.1f} inserts/s, "
+                f"loop lag p50 {statistics.median(lags) * 1000:8.2f} ms, p99 {p99 * 1000:8.2f} ms, "
+                f"max {max(lags) * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
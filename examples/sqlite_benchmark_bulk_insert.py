@@ -0,0 +1,70 @@
+"""
+Compares per-row `Db.execute(InsertQuery)` against `Db.execute_many` w/
+`BulkInsertQuery`.
+
+Usage: sqlite_benchmark_bulk_insert.py [N_ROWS_PER_ROW_PATH] [N_ROWS_BULK]
+"""
+
+import pathlib
+import sys
+import tempfile
+import time
+import tired.logging
+import tired.sqlite
+
+
+def make_db(directory, name):
+    quantity = tired.sqlite.InfoField("quantity", int)
+    name_field = tired.sqlite.InfoField("name", str)
+    table = tired.sqlite.Table("item")
+    table.add_field(quantity)
+    table.add_field(name_field)
+
+    generate_db = tired.sqlite.GenerateDbScript()
+    generate_db.add_table(table)
+
+    db = tired.sqlite.Db([table])
+    db.connect(str(pathlib.Path(directory) / name))
+    db.execute_script(generate_db)
+
+    return db, table, quantity, name_field
+
+
+def benchmark_per_row(directory, n_rows):
+    db, table, quantity, name_field = make_db(directory, "per_row.db")
+    time_start = time.perf_counter()
+
+    for i in range(n_rows):
+        insert = tired.sqlite.InsertQuery(table)
+        insert.add_value(quantity, i)
+        insert.add_value(name_field, f"item {i}")
+        db.execute(insert)
+
+    return n_rows / (time.perf_counter() - time_start)
+
+
+def benchmark_bulk(directory, n_rows):
+    db, table, quantity, name_field = make_db(directory, "bulk.db")
+    time_start = time.perf_counter()
+
+    insert = tired.sqlite.BulkInsertQuery(table)
+    insert.add_field(quantity)
+    insert.add_field(name_field)
+    insert.add_rows((i, f"item {i}") for i in range(n_rows))
+    db.execute_many(insert, chunk_size=10000)
+
+    return n_rows / (time.perf_counter() - time_start)
+
+
+def main():
+    n_rows_per_row = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_rows_bulk = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+    tired.logging.set_level(tired.logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"per-row InsertQuery:  {benchmark_per_row(directory, n_rows_per_row):12.0f} rows/s ({n_rows_per_row} rows)")
+        print(f"BulkInsertQuery:      {benchmark_bulk(directory, n_rows_bulk):12.0f} rows/s ({n_rows_bulk} rows)")
+
+
+if __name__ == "__main__":
+    main()
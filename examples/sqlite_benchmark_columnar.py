@@ -0,0 +1,73 @@
+"""
+Compares building per-column buffers from `Db.execute` results against
+`Db.execute_columnar`: time, and peak memory traced by `tracemalloc` (in
+a separate run, as tracing slows allocations down).
+
+Usage: sqlite_benchmark_columnar.py [N_ROWS]
+"""
+
+import array
+import sys
+import time
+import tracemalloc
+import tired.logging
+import tired.sqlite
+
+
+def make_db(n_rows):
+    quantity = tired.sqlite.InfoField("quantity", int)
+    name_field = tired.sqlite.InfoField("name", str)
+    table = tired.sqlite.Table("item")
+    table.add_field(quantity)
+    table.add_field(name_field)
+
+    generate_db = tired.sqlite.GenerateDbScript()
+    generate_db.add_table(table)
+
+    db = tired.sqlite.Db([table])
+    db.connect(":memory:")
+    db.execute_script(generate_db)
+
+    insert = tired.sqlite.BulkInsertQuery(table)
+    insert.add_field(quantity)
+    insert.add_field(name_field)
+    insert.add_rows((i, f"item {i}") for i in range(n_rows))
+    db.execute_many(insert)
+
+    query = tired.sqlite.InnerJoinSelectQuery(table)
+    query.add_field(table.get_id_field())
+    query.add_field(quantity)
+    query.add_field(name_field)
+
+    return db, query
+
+
+def convert_rows(db, query):
+    rows = db.execute(query)
+    ids, quantities, names = zip(*rows)
+
+    return array.array('q', ids), array.array('q', quantities), list(names)
+
+
+def measure(name, fetch):
+    time_start = time.perf_counter()
+    fetch()
+    duration = time.perf_counter() - time_start
+    tracemalloc.start()
+    fetch()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<12} {duration * 1000:8.1f} ms, peak {peak / 2 ** 20:8.1f} MiB")
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    tired.logging.set_level(tired.logging.ERROR)
+    db, query = make_db(n_rows)
+
+    measure("rows", lambda: convert_rows(db, query))
+    measure("columnar", lambda: db.execute_columnar(query))
+
+
+if __name__ == "__main__":
+    main()
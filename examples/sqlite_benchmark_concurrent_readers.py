@@ -0,0 +1,113 @@
+"""
+Runs parallel `InnerJoinSelectQuery` readers against a writer that keeps
+inserting rows, once w/ a single shared connection, and once w/ a pool of
+reader connections.
+
+Usage: sqlite_benchmark_concurrent_readers.py [N_READER_THREADS] [DURATION_S]
+"""
+
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+import tired.logging
+import tired.sqlite
+
+
+N_PARENTS = 100
+N_CHILDREN = 20000
+
+
+def make_db(directory, name, n_readers):
+    quantity = tired.sqlite.InfoField("quantity", int)
+    name_field = tired.sqlite.InfoField("name", str)
+    parent = tired.sqlite.Table("parent")
+    parent.add_field(name_field)
+    child = tired.sqlite.Table("child")
+    child.add_field(tired.sqlite.ForeignIdField(parent))
+    child.add_field(quantity)
+
+    generate_db = tired.sqlite.GenerateDbScript()
+    generate_db.add_table(parent)
+    generate_db.add_table(child)
+
+    db = tired.sqlite.Db([parent, child])
+    db.connect(str(pathlib.Path(directory) / name), n_readers=n_readers)
+    db.execute_script(generate_db)
+
+    insert = tired.sqlite.BulkInsertQuery(parent)
+    insert.add_field(name_field)
+    insert.add_rows((f"parent {i}",) for i in range(N_PARENTS))
+    db.execute_many(insert)
+
+    insert = tired.sqlite.BulkInsertQuery(child)
+    insert.add_field(tired.sqlite.ForeignIdField(parent))
+    insert.add_field(quantity)
+    insert.add_rows((i % N_PARENTS + 1, i) for i in range(N_CHILDREN))
+    db.execute_many(insert)
+
+    return db, parent, child, quantity, name_field
+
+
+def benchmark(directory, name, n_reader_threads, n_readers, duration):
+    db, parent, child, quantity, name_field = make_db(directory, name, n_readers)
+    is_running = True
+    n_reads = [0] * n_reader_threads
+    n_writes = 0
+
+    def read(thread_id):
+        i = 0
+
+        while is_running:
+            query = tired.sqlite.InnerJoinSelectQuery(child)
+            query.add_field(quantity)
+            query.add_parent_table_field(parent, name_field, child)
+            query.add_eq_constraint(parent, parent.get_id_field(), i % N_PARENTS + 1)
+            db.execute(query)
+            n_reads[thread_id] += 1
+            i += 1
+
+    def write():
+        nonlocal n_writes
+        i = 0
+
+        while is_running:
+            insert = tired.sqlite.InsertQuery(child)
+            insert.add_value(tired.sqlite.ForeignIdField(parent), i % N_PARENTS + 1)
+            insert.add_value(quantity, i)
+            db.execute(insert)
+            n_writes += 1
+            i += 1
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(n_reader_threads)]
+    threads.append(threading.Thread(target=write))
+
+    for thread in threads:
+        thread.start()
+
+    time.sleep(duration)
+    is_running = False
+
+    for thread in threads:
+        thread.join()
+
+    db.close()
+
+    return sum(n_reads) / duration, n_writes / duration
+
+
+def main():
+    n_reader_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    tired.logging.set_level(tired.logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, n_readers in [("shared.db", 0), ("pooled.db", n_reader_threads)]:
+            reads, writes = benchmark(directory, name, n_reader_threads, n_readers, duration)
+            print(f"{n_reader_threads} reader threads, {n_readers} reader connections: "
+                f"{reads:10.1f} selects/s, {writes:10.1f} inserts/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares seeding a table w/ a per-row `InsertQuery` loop (in one
+transaction) against `Db.import_rows`, and measures `Db.export_rows`, for CSV and JSONL.
+
+Usage: sqlite_benchmark_import_export.py [N_ROWS]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tired.logging
+import tired.sqlite
+
+
+def make_db(filename):
+    quantity = tired.sqlite.InfoField("quantity", int)
+    name_field = tired.sqlite.InfoField("name", str)
+    table = tired.sqlite.Table("item")
+    table.add_field(quantity)
+    table.add_field(name_field)
+
+    generate_db = tired.sqlite.GenerateDbScript()
+    generate_db.add_table(table)
+
+    db = tired.sqlite.Db([table])
+    db.connect(filename)
+    db.execute_script(generate_db)
+
+    return db, table, quantity, name_field
+
+
+def insert_rows(directory, n_rows):
+    db, table, quantity, name_field = make_db(os.path.join(directory, "insert.db"))
+
+    with db.transaction():
+        for i in range(n_rows):
+            insert = tired.sqlite.InsertQuery(table)
+            insert.add_value(quantity, i)
+            insert.add_value(name_field, f"item {i}")
+            db.execute(insert)
+
+    query = tired.sqlite.InnerJoinSelectQuery(table)
+    query.add_field(quantity)
+    query.add_field(name_field)
+
+    return db, query
+
+
+def measure(name, n_rows, function):
+    time_start = time.perf_counter()
+    result = function()
+    print(f"{name:<16} {n_rows / (time.perf_counter() - time_start):10.0f} rows/s")
+
+    return result
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    tired.logging.set_level(tired.logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db, query = measure("InsertQuery loop", n_rows, lambda: insert_rows(directory, n_rows))
+
+        for data_format in ["csv", "jsonl"]:
+            path = os.path.join(directory, "items." + data_format)
+            measure(f"export {data_format}", n_rows, lambda: db.export_rows(query, path))
+            import_db, table, *_ = make_db(os.path.join(directory, f"import_{data_format}.db"))
+            measure(f"import {data_format}", n_rows, lambda: import_db.import_rows(table, path))
+
+
+if __name__ == "__main__":
+    main()
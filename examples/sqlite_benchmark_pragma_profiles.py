@@ -0,0 +1,95 @@
+"""
+Measures insert and join-select throughput for each of
+`tired.sqlite.PRAGMA_PROFILES`, and for SQLite defaults.
+
+Usage: sqlite_benchmark_pragma_profiles.py [N_ROWS]
+"""
+
+import pathlib
+import sys
+import tempfile
+import time
+import tired.logging
+import tired.sqlite
+
+
+N_PARENTS = 100
+N_SINGLE_INSERTS = 1000
+N_SELECTS = 200
+
+
+def make_db(path, profile):
+    quantity = tired.sqlite.InfoField("quantity", int)
+    name_field = tired.sqlite.InfoField("name", str)
+    parent = tired.sqlite.Table("parent")
+    parent.add_field(name_field)
+    child = tired.sqlite.Table("child")
+    child.add_field(tired.sqlite.ForeignIdField(parent))
+    child.add_field(quantity)
+
+    generate_db = tired.sqlite.GenerateDbScript()
+    generate_db.add_table(parent)
+    generate_db.add_table(child)
+
+    db = tired.sqlite.Db([parent, child])
+    db.connect(path, profile=profile)
+    db.execute_script(generate_db)
+
+    return db, parent, child, quantity, name_field
+
+
+def benchmark(path, profile, n_rows):
+    db, parent, child, quantity, name_field = make_db(path, profile)
+    result = dict()
+
+    insert = tired.sqlite.BulkInsertQuery(parent)
+    insert.add_field(name_field)
+    insert.add_rows((f"parent {i}",) for i in range(N_PARENTS))
+    db.execute_many(insert)
+
+    time_start = time.perf_counter()
+    insert = tired.sqlite.BulkInsertQuery(child)
+    insert.add_field(tired.sqlite.ForeignIdField(parent))
+    insert.add_field(quantity)
+    insert.add_rows((i % N_PARENTS + 1, i) for i in range(n_rows))
+    db.execute_many(insert, chunk_size=10000)
+    result["bulk inserts/s"] = n_rows / (time.perf_counter() - time_start)
+
+    time_start = time.perf_counter()
+
+    for i in range(N_SINGLE_INSERTS):
+        insert = tired.sqlite.InsertQuery(child)
+        insert.add_value(tired.sqlite.ForeignIdField(parent), i % N_PARENTS + 1)
+        insert.add_value(quantity, i)
+        db.execute(insert)
+
+    result["commits/s"] = N_SINGLE_INSERTS / (time.perf_counter() - time_start)
+
+    time_start = time.perf_counter()
+
+    for i in range(N_SELECTS):
+        query = tired.sqlite.InnerJoinSelectQuery(child)
+        query.add_field(quantity)
+        query.add_parent_table_field(parent, name_field, child)
+        query.add_eq_constraint(parent, parent.get_id_field(), i % N_PARENTS + 1)
+        db.execute(query)
+
+    result["join selects/s"] = N_SELECTS / (time.perf_counter() - time_start)
+    db.close()
+
+    return result
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    tired.logging.set_level(tired.logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in [None, *tired.sqlite.PRAGMA_PROFILES.keys()]:
+            path = str(pathlib.Path(directory) / f"{profile}.db")
+            result = benchmark(path, profile, n_rows)
+            print(f"{str(profile):12}", ', '.join(f"{v:10.1f} {k}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compares repeated id lookups joined w/ a parent table, w/ and w/o a
+`QueryCache`. Every `WRITE_EVERY`-th lookup is preceded by an update of the
+parent table, which invalidates the cached results.
+
+Usage: sqlite_benchmark_query_cache.py [N_LOOKUPS] [N_IDS]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+import tired.logging
+import tired.sqlite
+
+
+WRITE_EVERY = 10000
+
+
+def make_db(directory, n_ids):
+    name_field = tired.sqlite.InfoField("name", str)
+    quantity = tired.sqlite.InfoField("quantity", int)
+    parent = tired.sqlite.Table("parent")
+    parent.add_field(name_field)
+    child = tired.sqlite.Table("child")
+    child.add_field(tired.sqlite.ForeignIdField(parent))
+    child.add_field(quantity)
+
+    generate_db = tired.sqlite.GenerateDbScript()
+    generate_db.add_table(parent)
+    generate_db.add_table(child)
+
+    db = tired.sqlite.Db([parent, child])
+    db.connect(os.path.join(directory, "cache.db"), n_readers=2)
+    db.execute_script(generate_db)
+
+    insert = tired.sqlite.BulkInsertQuery(parent)
+    insert.add_field(name_field)
+    insert.add_rows((f"parent {i}",) for i in range(100))
+    db.execute_many(insert)
+
+    insert = tired.sqlite.BulkInsertQuery(child)
+    insert.add_field(tired.sqlite.ForeignIdField(parent))
+    insert.add_field(quantity)
+    insert.add_rows((i % 100 + 1, i) for i in range(n_ids))
+    db.execute_many(insert)
+
+    return db, parent, child, name_field, quantity
+
+
+def measure(db, parent, child, name_field, quantity, n_lookups, n_ids):
+    random.seed(0)
+    time_start = time.perf_counter()
+
+    for i in range(n_lookups):
+        if i % WRITE_EVERY == 0:
+            update = tired.sqlite.UpdateQuery(parent)
+            update.add_field(name_field, f"parent {i}")
+            update.add_eq_constraint(parent.get_id_field(), random.randint(1, 100))
+            db.execute(update)
+
+        query = tired.sqlite.InnerJoinSelectQuery(child)
+        query.add_field(quantity)
+        query.add_parent_table_field(parent, name_field, child)
+        query.add_eq_constraint(child, child.get_id_field(), random.randint(1, n_ids))
+        db.execute(query)
+
+    return n_lookups / (time.perf_counter() - time_start)
+
+
+def main():
+    n_lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    n_ids = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    tired.logging.set_level(tired.logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        db, *fields = make_db(directory, n_ids)
+
+        print(f"uncached: {measure(db, *fields, n_lookups, n_ids):10.0f} lookups/s")
+
+        cache = tired.sqlite.QueryCache()
+        db.set_cache(cache)
+        print(f"cached:   {measure(db, *fields, n_lookups, n_ids):10.0f} lookups/s")
+        print(f"hits: {cache.n_hits}, misses: {cache.n_misses}, evictions: {cache.n_evictions}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
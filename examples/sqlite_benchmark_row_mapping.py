@@ -0,0 +1,78 @@
+"""
+Compares the cost of fetching a select result as plain tuples, as
+`sqlite3.Row`, and as mapped rows (`Db.execute(query, mapped=True)`).
+
+Usage: sqlite_benchmark_row_mapping.py [N_ROWS]
+"""
+
+import sqlite3
+import sys
+import time
+import tired.logging
+import tired.sqlite
+
+
+N_REPEATS = 5
+
+
+def make_db(n_rows):
+    quantity = tired.sqlite.InfoField("quantity", int)
+    name_field = tired.sqlite.InfoField("name", str)
+    table = tired.sqlite.Table("item")
+    table.add_field(quantity)
+    table.add_field(name_field)
+
+    generate_db = tired.sqlite.GenerateDbScript()
+    generate_db.add_table(table)
+
+    db = tired.sqlite.Db([table])
+    db.connect(":memory:")
+    db.execute_script(generate_db)
+
+    insert = tired.sqlite.BulkInsertQuery(table)
+    insert.add_field(quantity)
+    insert.add_field(name_field)
+    insert.add_rows((i, f"item {i}") for i in range(n_rows))
+    db.execute_many(insert)
+
+    query = tired.sqlite.InnerJoinSelectQuery(table)
+    query.add_field(table.get_id_field())
+    query.add_field(quantity)
+    query.add_field(name_field)
+
+    return db, query
+
+
+def measure(n_rows, fetch):
+    best = None
+
+    for _ in range(N_REPEATS):
+        time_start = time.perf_counter()
+        rows = fetch()
+        sum(map(lambda i: i[1], rows))
+        duration = time.perf_counter() - time_start
+        best = duration if best is None else min(best, duration)
+
+    return n_rows / best
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    tired.logging.set_level(tired.logging.ERROR)
+    db, query = make_db(n_rows)
+    sql, parameters = query.generate_sql_parameterized()
+
+    def fetch_row():
+        cur = db._conn.cursor()
+        cur.row_factory = sqlite3.Row
+        return cur.execute(sql, parameters).fetchall()
+
+    print(f"tuple:       {measure(n_rows, lambda: db.execute(query)):12.0f} rows/s")
+    print(f"sqlite3.Row: {measure(n_rows, fetch_row):12.0f} rows/s")
+    print(f"mapped:      {measure(n_rows, lambda: db.execute(query, mapped=True)):12.0f} rows/s")
+
+    print(db.execute(query, mapped=True)[0])
+
+
+if __name__ == "__main__":
+    main()
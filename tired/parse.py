@@ -1,3 +1,8 @@
+import bisect
+import contextlib
+import itertools
+import mmap
+import os
 import re
 import dataclasses
 
@@ -31,55 +36,113 @@ class LexingResult:
         return string[self.end_position:]
 
 
+class BracketMatchIndex:
+    """
+    Positions of matching braces for one or more brace pairs, built in one
+    regex-driven pass over a string. Each pair is balanced on its own,
+    braces of other pairs are ignored. Lookups for the same string object
+    reuse the index, a different string gets it rebuilt.
+
+    Lexers may share an index (see `SingleBracePairBalanceLexer`), so a
+    string is scanned once for all the pairs.
+    """
+
+    def __init__(self, pairs):
+        """
+        pairs: iterable of `(lbrace, rbrace)`, single characters
+        """
+        self._pairs = dict(pairs)
+        self._lbraces = {v: k for k, v in self._pairs.items()}
+        assert all(map(lambda i: len(i) == 1, [*self._pairs, *self._lbraces])), "Braces must be single characters"
+        self._regex = re.compile('[' + ''.join(map(re.escape, {*self._pairs, *self._lbraces})) + ']')
+        self._string = None
+
+    def has_pair(self, lbrace, rbrace):
+        return self._pairs.get(lbrace) == rbrace
+
+    def _build(self, string):
+        self._opens = {i: list() for i in self._pairs}  # lbrace -> sorted positions
+        self._closes = dict()  # lbrace position -> matching rbrace position
+        stacks = {i: list() for i in self._pairs}
+
+        for match in self._regex.finditer(string):
+            ch = match.group()
+
+            if ch in self._pairs:
+                self._opens[ch].append(match.start())
+                stacks[ch].append(match.start())
+            else:
+                stack = stacks[self._lbraces[ch]]
+
+                if len(stack):
+                    self._closes[stack.pop()] = match.start()
+
+        self._string = string
+
+    def find(self, string, lbrace, pos=0, endpos=None):
+        """
+        Returns `(lbrace position, rbrace position)` for the first `lbrace`
+        within `string[pos:endpos]`, or None. The rbrace position is None,
+        if the brace is never closed.
+        """
+        if string is not self._string:
+            self._build(string)
+
+        if endpos is None:
+            endpos = len(string)
+
+        opens = self._opens[lbrace]
+        i = bisect.bisect_left(opens, pos)
+
+        if i == len(opens) or opens[i] >= endpos:
+            return None
+
+        return opens[i], self._closes.get(opens[i])
+
+
 @dataclasses.dataclass
 class SingleBracePairBalanceLexer:
     """
     Parses brace-enclosed chunks.
     Implements a "push-pop" parser that starts on the first encounter of
-    `lbrace`, and stops, when the stack is empty.
+    `lbrace`, and stops, when the stack is empty. The resulting chunk spans
+    from the `lbrace` up to (not including) the matching `rbrace`.
+
+    Matching braces are looked up in a `BracketMatchIndex`, so repeated
+    calls on the same string do not rescan it.
     """
     identifier: object
     lbrace: str
     rbrace: str
 
-    def __post_init__(self):
-        self._reset()
-
-    def _reset(self):
-        self._lexing_result = LexingResult(start_position=0, end_position=0,
-            chunk='', lexer_identifier=self.identifier)
-        self._balance = -1
-
-    def _on_start(self, string, pos):
-        self._lexing_result.start_position = pos
-
-    def _on_end(self, string, pos):
-        self._lexing_result.end_position = pos
-        self._lexing_result.chunk = string[self._lexing_result.start_position:self._lexing_result.end_position]
+    match_index: object = None
+    """
+    `BracketMatchIndex` shared w/ other lexers. If None, the lexer makes
+    its own one
+    """
 
-    def try_get_closest_lex(self, string):
-        self._reset()
+    def __post_init__(self):
+        if self.match_index is None:
+            self.match_index = BracketMatchIndex([(self.lbrace, self.rbrace)])
 
-        for pos in range(len(string)):
-            ch = string[pos]
+        assert self.match_index.has_pair(self.lbrace, self.rbrace)
 
-            if ch == self.lbrace:
-                # push
-                if self._balance == -1:
-                    self._on_start(string, pos)
-                    self._balance = 0
+    def try_get_closest_lex(self, string, pos=0, endpos=None):
+        """
+        See `GenericRegexLexer.try_get_closest_lex`
+        """
+        if endpos is None:
+            endpos = len(string)
 
-                self._balance += 1
-            elif ch == self.rbrace and self._balance > 0:
-                # pop
-                self._balance -= 1
+        braces = self.match_index.find(string, self.lbrace, pos, endpos)
 
-                if self._balance == 0:
-                    self._on_end(string, pos)
+        if braces is None or braces[1] is None or braces[1] >= endpos:
+            return None
 
-                    return self._lexing_result
+        start_position, end_position = braces
 
-        return None
+        return LexingResult(start_position=start_position, end_position=end_position,
+            chunk=string[start_position:end_position], lexer_identifier=self.identifier)
 
 
 class GenericRegexLexer:
@@ -87,23 +150,28 @@ class GenericRegexLexer:
         self._expression = expression
         self._flags = re_flags
         self._identifier = identifier
+        self._regex = re.compile(expression, re_flags)
 
-    def try_get_closest_lex(self, string):
-        """ lexer_identifier: hashable """
-        regex = re.compile(self._expression)
-        it = iter(regex.finditer(string, self._flags))
+    def try_get_closest_lex(self, string, pos=0, endpos=None):
+        """
+        Looks for the first match within `string[pos:endpos]` w/o slicing
+        the string, so positions of the result are relative to the whole
+        `string`.
 
-        try:
-            result = next(it)
-        except StopIteration as e:
-            return None
+        lexer_identifier: hashable
+        """
+        if endpos is None:
+            endpos = len(string)
+
+        result = self._regex.search(string, pos, endpos)
 
-        #print(result, regex)
+        if result is None:
+            return None
 
         return LexingResult(
             start_position=result.start(),
             end_position=result.end(),
-            chunk=string[result.start():result.end()],
+            chunk=result.group(0),
             lexer_identifier=self._identifier,
         )
 
@@ -158,10 +226,11 @@ class Tokenizer:
     def add_lexer(self, lexer):
         self._lexers.append(lexer)
 
-    def tokenize(self, string, resolution_strategy=None):
+    def tokenize(self, string, resolution_strategy=None, pos=0):
         """
-        Runs all lexers on an input, returns lexer which got the
-        sequence closer to the start.
+        Runs all lexers on an input starting from `pos`, returns lexer which
+        got the sequence closer to the start. Positions of the result are
+        relative to the whole `string`.
         - If 2 or more returned a token, `Lexer.CommonAmbiguity` exception
           is raised.
         - When none of the lexers were able to tokenize, `StopIteration` is
@@ -175,7 +244,7 @@ class Tokenizer:
             resolution_strategy = self._resolution_strategy
 
         # Merge results from all lexers
-        results = map(lambda instance: instance.try_get_closest_lex(string), self._lexers)
+        results = map(lambda instance: instance.try_get_closest_lex(string, pos), self._lexers)
         results = filter(lambda i: i is not None, results)
 
         results = list(results)
@@ -185,6 +254,359 @@ class Tokenizer:
 
         return resolution_strategy.resolve(results)
 
+    def iter_tokens(self, text, start=0, resolution_strategy=None):
+        """
+        Lazily yields tokens one after another, each one is looked for
+        starting from the end of the previous one. Nothing is sliced off
+        `text`, positions are relative to it.
+        """
+        while True:
+            try:
+                result = self.tokenize(text, resolution_strategy, start)
+            except StopIteration:
+                return
+
+            yield result
+            start = result.end_position
+
+
+_SCOPED_FLAGS = [
+    (re.ASCII, 'a'),
+    (re.IGNORECASE, 'i'),
+    (re.MULTILINE, 'm'),
+    (re.DOTALL, 's'),
+    (re.VERBOSE, 'x'),
+]
+
+
+_GLOBAL_FLAGS_REGEX = re.compile(r'\(\?([aiLmsux]+)\)')
+
+
+def _make_scoped_expression(expression, flags):
+    """
+    Wraps the expression into a group w/ its own flags, so it may be merged
+    w/ others. Leading global inline flags, e.g. `(?i)`, are moved into the
+    group, as they are only allowed at the start of the whole expression
+    """
+    letters = ''.join(letter for flag, letter in _SCOPED_FLAGS if flags & flag)
+    match = _GLOBAL_FLAGS_REGEX.match(expression)
+
+    while match is not None:
+        letters += ''.join(i for i in match.group(1) if i not in letters)
+        expression = expression[match.end():]
+        match = _GLOBAL_FLAGS_REGEX.match(expression)
+
+    if 'x' in letters:
+        # A trailing comment must not swallow the closing parenthesis
+        expression += '\n'
+
+    return f'(?{letters}:{expression})'
+
+
+class CompiledTokenizer:
+    """
+    Same as `Tokenizer` w/ `ClosestLongestWinsResolutionStrategy`, but for
+    `GenericRegexLexer`s only (either all w/ `str`, or all w/ `bytes`
+    expressions), which are merged into one regex. Instead of
+    running every lexer over the rest of the string, the merged alternation
+    finds the closest position any lexer matches at, and a chain of
+    lookaheads, one named group per lexer, captures what each of them
+    matches there. The longest one wins.
+
+    Expressions MUST NOT use numbered backreferences, or group names that
+    clash b/w lexers, as the groups get renumbered. Global inline flags
+    (e.g. `(?i)`) are only supported at the start of an expression, where
+    they are scoped to it.
+    """
+
+    def __init__(self):
+        self._lexers = list()
+        self._search_regex = None
+        self._match_regex = None
+
+    def add_lexer(self, lexer):
+        assert isinstance(lexer, GenericRegexLexer), "Only regex lexers can be merged"
+        self._lexers.append(lexer)
+        self._search_regex = None
+
+    def _compile(self):
+        # `bytes` expressions are merged as text, each byte maps to one char
+        is_bytes = any(map(lambda i: type(i._expression) is bytes, self._lexers))
+        encode = (lambda i: i.encode("latin-1")) if is_bytes else (lambda i: i)
+        expressions = list(map(lambda i: _make_scoped_expression(
+            i._expression.decode("latin-1") if is_bytes else i._expression, i._flags), self._lexers))
+        self._search_regex = re.compile(encode('|'.join(expressions)))
+        self._match_regex = re.compile(encode(''.join(f'(?=(?P<_{i}>{e}))?' for i, e in enumerate(expressions))))
+        self._match_groups = [self._match_regex.groupindex[f'_{i}'] for i in range(len(expressions))]
+
+    def try_get_closest_lex(self, string, pos=0, endpos=None):
+        """
+        Returns the closest and longest `LexingResult` within
+        `string[pos:endpos]` (positions are relative to the whole `string`),
+        or None. Raises `AmbiguityResolutionFailure`, if several lexers get
+        equally long chunks.
+        """
+        if self._search_regex is None:
+            self._compile()
+
+        if endpos is None:
+            endpos = len(string)
+
+        closest = self._search_regex.search(string, pos, endpos)
+
+        if closest is None:
+            return None
+
+        match = self._match_regex.match(string, closest.start(), endpos)
+        results = [LexingResult(match.start(group), match.end(group), match.group(group), lexer._identifier)
+            for lexer, group in zip(self._lexers, self._match_groups) if match.start(group) != -1]
+
+        if len(results) == 1:
+            return results[0]
+
+        return ClosestLongestWinsResolutionStrategy().resolve(results)
+
+    def tokenize(self, string, pos=0):
+        """
+        See `Tokenizer.tokenize`, raises `StopIteration`, when there are no
+        tokens
+        """
+        result = self.try_get_closest_lex(string, pos)
+
+        if result is None:
+            raise StopIteration
+
+        return result
+
+    def iter_tokens(self, text, start=0):
+        """
+        Lazily yields tokens one after another, each one is looked for
+        starting from the end of the previous one
+        """
+        while True:
+            result = self.try_get_closest_lex(text, start)
+
+            if result is None:
+                return
+
+            yield result
+            start = result.end_position
+
+
+class IncrementalTokenStore:
+    """
+    Keeps the tokens of a text, as produced by `iter_tokens` of a
+    `Tokenizer` or a `CompiledTokenizer`, up to date w/ edits of the text.
+
+    On an edit, lexing restarts from the end of the last token that ends
+    strictly before the edit, and stops as soon as a token after the edit
+    coincides w/ an old one (shifted by the change in length): from there
+    on, the old tokens are still valid, as lexing only depends on the
+    position and the text ahead. So the cost of re-lexing depends on the
+    size of the edit rather than the size of the text.
+
+    Tokens that end before the edit are not revisited. So the result may be
+    inexact w/ lexers that look behind a token (lookbehind assertions,
+    `^`), or past its end (lookahead assertions), or whose chunks may span
+    text that used to be lexed differently, e.g. a block comment opened
+    before the edit, and closed by it.
+
+    Every edit makes a new string. So a `SingleBracePairBalanceLexer`
+    rebuilds its `BracketMatchIndex` over the whole text on each edit, and
+    the cost depends on the size of the text again.
+    """
+
+    _MAX_N_SHIFTS = 256
+    """
+    Pending shifts are applied to the tokens, once there are that many
+    """
+
+    def __init__(self, tokenizer, text=''):
+        self._tokenizer = tokenizer
+        self._text = text
+        self._tokens = list(tokenizer.iter_tokens(text))
+        # Positions of the tokens are updated lazily: from
+        # `_shift_indices[i]` on, positions are off by `_shifts[i]`. So an
+        # edit does not have to update every token after it
+        self._shift_indices = list()
+        self._shifts = list()
+
+    def _get_shift(self, index):
+        i = bisect.bisect_right(self._shift_indices, index)
+
+        return self._shifts[i - 1] if i else 0
+
+    def _apply_shifts(self):
+        bounds = self._shift_indices + [len(self._tokens)]
+
+        for begin, end, shift in zip(bounds, bounds[1:], self._shifts):
+            if shift:
+                for token in itertools.islice(self._tokens, begin, end):
+                    token.start_position += shift
+                    token.end_position += shift
+
+        self._shift_indices = list()
+        self._shifts = list()
+
+    def _find_first_token_ending_at_or_after(self, position):
+        """
+        Binary search over consecutive tokens
+        """
+        lo, hi = 0, len(self._tokens)
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+
+            if self._tokens[mid].end_position + self._get_shift(mid) < position:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo
+
+    def get_text(self):
+        return self._text
+
+    def get_tokens(self):
+        """
+        List of `LexingResult`, positions are relative to the current text
+        """
+        self._apply_shifts()
+
+        return self._tokens
+
+    def edit(self, start, end, replacement):
+        """
+        Replaces `text[start:end]` w/ `replacement`, and updates the tokens.
+        Returns `(index, n_removed, n_inserted)`: the position in the token
+        list, the number of old tokens replaced there, and the number of
+        new ones.
+
+        Tokens after the edit are not updated until `get_tokens`, so the
+        cost of an edit does not depend on the number of tokens after it.
+        """
+        assert 0 <= start <= end <= len(self._text)
+        text = self._text[:start] + replacement + self._text[end:]
+        shift = len(replacement) - (end - start)
+        edit_end = start + len(replacement)
+        first = self._find_first_token_ending_at_or_after(start)
+        old = first
+        new_tokens = list()
+
+        for token in self._tokenizer.iter_tokens(text, self._tokens[first - 1].end_position
+                + self._get_shift(first - 1) if first else 0):
+            if token.start_position >= edit_end:
+                # Past the edit, look for the old token at the same place
+                while old < len(self._tokens) \
+                        and self._tokens[old].start_position + self._get_shift(old) + shift < token.start_position:
+                    old += 1
+
+                if old < len(self._tokens):
+                    old_shift = self._get_shift(old) + shift
+
+                    if self._tokens[old].start_position + old_shift == token.start_position \
+                            and self._tokens[old].end_position + old_shift == token.end_position \
+                            and self._tokens[old].lexer_identifier == token.lexer_identifier:
+                        break
+
+            new_tokens.append(token)
+        else:
+            old = len(self._tokens)
+
+        # New tokens get the shift of the tokens before them, the shifts of
+        # the old tokens after them grow by `shift`
+        base_shift = self._get_shift(first - 1) if first else 0
+
+        for token in new_tokens:
+            token.start_position -= base_shift
+            token.end_position -= base_shift
+
+        i_first = bisect.bisect_left(self._shift_indices, first)
+
+        if old < len(self._tokens):
+            i_old = bisect.bisect_right(self._shift_indices, old)
+            n_inserted = len(new_tokens) - (old - first)
+            indices = [first + len(new_tokens)] + [i + n_inserted for i in self._shift_indices[i_old:]]
+            shifts = [self._get_shift(old) + shift] + [i + shift for i in self._shifts[i_old:]]
+        else:
+            indices, shifts = list(), list()
+
+        self._shift_indices[i_first:] = indices
+        self._shifts[i_first:] = shifts
+        self._tokens[first:old] = new_tokens
+        self._text = text
+
+        if len(self._shifts) > self._MAX_N_SHIFTS:
+            self._apply_shifts()
+
+        return first, old - first, len(new_tokens)
+
+
+@contextlib.contextmanager
+def open_mmap(path):
+    """
+    Maps a file read-only. The map may be lexed by regex lexers w/ `bytes`
+    expressions, or split by `iterate_buffer_multiline` w/o reading the file
+    into memory, the OS pages it in on demand. `memoryview`s of the map MUST
+    be released before the scope ends. An empty file gives `b''`.
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b''
+
+            return
+
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            yield buffer
+        finally:
+            buffer.close()
+
+
+def iter_file_tokens(tokenizer, path, chunk_size=2 ** 20, max_token_size=2 ** 12):
+    """
+    Runs `iter_tokens` of a `Tokenizer` or a `CompiledTokenizer` w/ `bytes`
+    regex lexers over a file read in chunks of `chunk_size` bytes. Positions
+    of the tokens are file offsets.
+
+    A token close to the end of what has been read so far might continue in
+    the next chunk, so tokens ending within `max_token_size` bytes of it are
+    postponed until the next chunk is read. Tokens (along w/ any lookahead)
+    MUST NOT be longer than `max_token_size`. The memory use is bounded by
+    `chunk_size + max_token_size`.
+    """
+    assert chunk_size > max_token_size
+    buffer = b''
+    offset = 0  # File offset of `buffer`
+    position = 0  # Lexing continues from here
+
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            is_eof = not len(chunk)
+            buffer = buffer[position:] + chunk
+            offset += position
+            position = 0
+            limit = len(buffer) if is_eof else len(buffer) - max_token_size
+
+            for token in tokenizer.iter_tokens(buffer, position):
+                if token.end_position > limit:
+                    # No token, that is closer, can start before the limit
+                    position = max(position, min(token.start_position, limit))
+
+                    break
+
+                position = token.end_position
+
+                # The token itself is where `iter_tokens` continues from
+                yield LexingResult(token.start_position + offset, token.end_position + offset, token.chunk,
+                    token.lexer_identifier)
+            else:
+                position = max(position, limit)
+
+            if is_eof:
+                return
 
 
 def iterate_string_multiline(string: str, min_n_newline_symbols=1):
@@ -216,9 +638,134 @@ def iterate_string_multiline(string: str, min_n_newline_symbols=1):
         yield(chunk)
 
 
+def _get_buffer_multiline_format(buffer):
+    """
+    Same as `_get_multiline_format`, but detects the format by the first line
+    break, so a large buffer is not scanned several times
+    """
+    match = re.search(rb"\r\n|\n|\r", buffer)
+
+    if match is None:
+        return None
+
+    return match.group()
+
+
+def iterate_buffer_multiline(buffer, min_n_newline_symbols=1, encoding=None):
+    """
+    Same as `iterate_string_multiline`, but for `bytes`, `bytearray`, or
+    `mmap` (see `open_mmap`) buffers. Yields `memoryview` slices of the
+    buffer w/o copying, or, if `encoding` is given, lines decoded one at a
+    time.
+    """
+    multiline_format = _get_buffer_multiline_format(buffer)
+
+    with memoryview(buffer) as view:
+        def make_line(begin, end):
+            return view[begin:end] if encoding is None else str(view[begin:end], encoding)
+
+        if multiline_format is None:
+            if len(buffer) > 0:
+                yield make_line(0, len(buffer))
+
+            return
+
+        regex = b'(' + multiline_format + b')' + b"{%d,}" % min_n_newline_symbols
+        text_body_position_begin = 0
+
+        for m in re.finditer(regex, buffer):
+            text_body_position_end, next_test_body_position_begin = m.span(0)
+
+            if text_body_position_end > text_body_position_begin:
+                yield make_line(text_body_position_begin, text_body_position_end)
+
+            text_body_position_begin = next_test_body_position_begin
+
+        if len(buffer) > text_body_position_begin:
+            yield make_line(text_body_position_begin, len(buffer))
+
+
+def iterate_file_multiline(path, min_n_newline_symbols=1, encoding="utf-8"):
+    """
+    Splits a file of any size, see `iterate_buffer_multiline`. Lines are
+    decoded, or returned as `bytes`, if `encoding` is None.
+    """
+    with open_mmap(path) as buffer, \
+            contextlib.closing(iterate_buffer_multiline(buffer, min_n_newline_symbols)) as lines:
+        for line in lines:
+            with line:
+                yield line.tobytes() if encoding is None else str(line, encoding)
+
+
 def split_string_space(string: str) -> list:
     """
     Splits string by spaces or tabs
     """
     return list(re.split(r"\s+", string))
 
+
+def test_incremental_token_store():
+    import random
+
+    def make_tokenizer():
+        tokenizer = CompiledTokenizer()
+        tokenizer.add_lexer(GenericRegexLexer("identifier", r'[a-zA-Z_][a-zA-Z0-9_]*'))
+        tokenizer.add_lexer(GenericRegexLexer("number", r'[0-9]+'))
+        tokenizer.add_lexer(GenericRegexLexer("punctuation", r'[^\sa-zA-Z0-9_]'))
+
+        return tokenizer
+
+    random.seed(0)
+    tokenizer = make_tokenizer()
+
+    for n_max_shifts in [1, 4, 256]:
+        text = "int main(int argc, char **argv) { return argc + 42; }\n" * 4
+        store = IncrementalTokenStore(make_tokenizer(), text)
+        store._MAX_N_SHIFTS = n_max_shifts
+
+        for i in range(300):
+            start = random.randint(0, len(text))
+            end = min(len(text), start + random.randint(0, 4))
+            replacement = ''.join(random.choice("ab1 +(\n") for _ in range(random.randint(0, 4)))
+            text = text[:start] + replacement + text[end:]
+            store.edit(start, end, replacement)
+
+            if i % 7 == 0:
+                expected = [(i.start_position, i.end_position, i.chunk, i.lexer_identifier)
+                    for i in tokenizer.iter_tokens(text)]
+                assert expected == [(i.start_position, i.end_position, i.chunk, i.lexer_identifier)
+                    for i in store.get_tokens()]
+                assert text == store.get_text()
+
+
+def test_iter_file_tokens():
+    import random
+    import tempfile
+
+    tokenizer = CompiledTokenizer()
+    tokenizer.add_lexer(GenericRegexLexer("identifier", rb'[a-zA-Z_][a-zA-Z0-9_]*'))
+    tokenizer.add_lexer(GenericRegexLexer("number", rb'[0-9]+'))
+    tokenizer.add_lexer(GenericRegexLexer("punctuation", rb'->|[^\sa-zA-Z0-9_]'))
+    random.seed(0)
+    words = [b"worker", b"42", b"->", b" ", b"\n", b"\n\n", b"[", b"]", b"x" * 30, b"1" * 20]
+    content = b''.join(random.choice(words) for _ in range(3000))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.txt")
+
+        with open(path, 'wb') as f:
+            f.write(content)
+
+        expected = [(i.start_position, i.end_position, i.chunk, i.lexer_identifier)
+            for i in tokenizer.iter_tokens(content)]
+
+        for chunk_size, max_token_size in [(65, 64), (100, 32), (1000, 64), (len(content) * 2, 64)]:
+            assert expected == [(i.start_position, i.end_position, i.chunk, i.lexer_identifier)
+                for i in iter_file_tokens(tokenizer, path, chunk_size, max_token_size)]
+
+        with open_mmap(path) as buffer:
+            assert expected == [(i.start_position, i.end_position, i.chunk, i.lexer_identifier)
+                for i in tokenizer.iter_tokens(buffer)]
+
+        lines = list(iterate_file_multiline(path, encoding=None))
+        assert lines == [i.encode() for i in iterate_string_multiline(content.decode())]
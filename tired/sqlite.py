@@ -1,6 +1,131 @@
+import array
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import csv
 import dataclasses
+import functools
+import itertools
+import json
+import os
+import pathlib
+import queue
 import sqlite3
+import threading
+import time
 import tired.logging
+import tired.ui
+import zlib
+
+
+def _generate_sql_literal(value):
+    """
+    Renders a value as an SQL literal. Only needed for scripts, as
+    `executescript` cannot bind parameters.
+    """
+    if value is None:
+        return 'null'
+    elif type(value) is bool:
+        return str(int(value))  # As `sqlite3` binds it
+    elif type(value) in [int, float]:
+        return str(value)
+    elif type(value) is bytes:
+        return f"x'{value.hex()}'"
+
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _inline_sql_parameters(sql, parameters):
+    """
+    Substitutes `?` placeholders w/ literals. Generated queries never contain
+    literals of their own, so each `?` IS a placeholder.
+    """
+    chunks = sql.split('?')
+    assert len(chunks) == len(parameters) + 1
+    literals = map(_generate_sql_literal, parameters)
+
+    return ''.join(itertools.chain.from_iterable(zip(chunks, literals))) + chunks[-1]
+
+
+@functools.lru_cache(maxsize=256)
+def _make_row_type(aliases):
+    """
+    A namedtuple type w/ one attribute per column alias. Instances are plain
+    tuples w/o a per-row `__dict__`.
+    """
+    return collections.namedtuple("Row", aliases, rename=True)
+
+
+def _make_row_factory(row_type):
+    new = tuple.__new__
+
+    return lambda cursor, row: new(row_type, row)
+
+
+class SqlShapeCache:
+    """
+    Compiled SQL text keyed by query "shape": tables, fields, joins and
+    constrained columns, but not the values. Queries of a known shape skip
+    building the text, only their parameters are collected.
+
+    Used by select queries. Insert, update, and delete statements are
+    cheaper to build than their shape is to hash. Thread-safe, as
+    `SQL_SHAPE_CACHE` is shared by all `Db`s.
+    """
+
+    def __init__(self, max_size=1024):
+        self._sql = collections.OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self.n_hits = 0
+        self.n_misses = 0
+
+    def get(self, shape, compile_sql):
+        """
+        Returns the SQL text for the shape, calling `compile_sql()` on a miss.
+        The least recently used shapes are evicted once there are `max_size`
+        of them.
+        """
+        with self._lock:
+            sql = self._sql.get(shape)
+
+            if sql is not None:
+                self._sql.move_to_end(shape)
+                self.n_hits += 1
+
+                return sql
+
+            self.n_misses += 1
+
+        sql = compile_sql()
+
+        with self._lock:
+            self._sql[shape] = sql
+            self._sql.move_to_end(shape)
+
+            while len(self._sql) > self._max_size:
+                self._sql.popitem(last=False)
+
+        return sql
+
+    def clear(self):
+        with self._lock:
+            self._sql.clear()
+
+
+SQL_SHAPE_CACHE = SqlShapeCache()
+
+
+def _generate_sql_parameterized(query):
+    """
+    Returns `(sql, parameters)` pair for a query. Objects that only provide
+    `generate_sql` are run w/o parameters.
+    """
+    if hasattr(query, "generate_sql_parameterized"):
+        return query.generate_sql_parameterized()
+
+    return query.generate_sql(), ()
 
 ######################################################################
 #           First order entities
@@ -35,9 +160,14 @@ class IdField:
     An autoincremented id field. SHOULD NOT be used directly, as each table has
     it by default.
     """
+    field_type = int
+
     def get_name(self):
         return "id"
 
+    def field_type_as_name(self):
+        return "integer"
+
     def generate_sql_create(self):
         return f'{self.get_name()} integer primary key autoincrement'
 
@@ -49,13 +179,62 @@ class ForeignIdField:
     """
     parent_table: object
 
+    indexed: bool = True
+    """
+    Whether an index is created for the field. Joins on the parent table, and
+    cascade deletes from it look up rows by this field.
+    """
+
+    field_type = int
+
     def get_name(self):
         return self.parent_table.get_name() + "_" + "id"
 
+    def field_type_as_name(self):
+        return "integer"
+
     def generate_sql_create(self):
         return f'{self.get_name()} integer not null'
 
 
+@dataclasses.dataclass
+class Index:
+    """
+    An index on one or more fields of a table. Is added to a table through
+    `Table.add_index`.
+    """
+    fields: list
+
+    unique: bool = False
+
+    where: str = None
+    """
+    Makes a partial index. An SQL expression that MAY NOT contain bound
+    parameters, e.g. `"quantity > 0"`
+    """
+
+    name: str = None
+    """
+    Generated from the table and field names, if None. Partial indices get
+    a checksum of `where` in the name
+    """
+
+    def get_name(self, table):
+        if self.name is not None:
+            return self.name
+
+        where = [] if self.where is None else ["where", f"{zlib.crc32(self.where.encode()):08x}"]
+
+        return '_'.join([table.get_name(), *map(lambda i: i.get_name(), self.fields), *where, "idx"])
+
+    def generate_sql_create(self, table):
+        unique = "unique " if self.unique else ""
+        columns = ', '.join(map(lambda i: i.get_name(), self.fields))
+        where = f" where {self.where}" if self.where is not None else ""
+
+        return f'create {unique}index if not exists {self.get_name(table)} on {table.get_name()} ({columns}){where};'
+
+
 @dataclasses.dataclass
 class Table:
     """
@@ -72,23 +251,52 @@ class Table:
 
     def __post_init__(self):
         self._fields = list()
+        self._indices = list()
         self._id_field = IdField()
         self._fields.append(self._id_field)
 
     def add_field(self, field):
         self._fields.append(field)
 
+    def get_fields(self):
+        return self._fields
+
+    def add_index(self, index):
+        assert index.get_name(self) not in map(lambda i: i.get_name(self), self._indices), \
+            f'Index "{index.get_name(self)}" is already declared, give it another name'
+        self._indices.append(index)
+
+    def _generate_indices_iter(self):
+        """
+        Declared indices, and ones for foreign keys, unless a declared
+        non-partial index already starts w/ the foreign key field
+        """
+        yield from self._indices
+        indexed_field_names = set(map(lambda i: i.fields[0].get_name(),
+            filter(lambda i: i.where is None, self._indices)))
+
+        for field in self._fields:
+            if type(field) is ForeignIdField and field.indexed \
+                    and field.get_name() not in indexed_field_names:
+                yield Index([field])
+
+    def generate_sql_create_indices(self):
+        return '\n'.join(map(lambda i: i.generate_sql_create(self), self._generate_indices_iter()))
+
     def _generate_foreign_key_create_iter(self):
         for field in self._fields:
             if type(field) is ForeignIdField:
                 yield f'foreign key ({field.get_name()}) references {field.parent_table.get_name()}(id) on update cascade on delete cascade'
 
-    def generate_sql_create(self):
+    def generate_sql_create(self, name=None):
+        """
+        `name` overrides the table's name, e.g. to create a copy
+        """
         fields = list(map(lambda i: i.generate_sql_create(), self._fields))
         foreign_keys = list(self._generate_foreign_key_create_iter())
 
         return '\n'.join([
-            f"create table if not exists {self.name} (",
+            f"create table if not exists {name or self.name} (",
             ',\n'.join([*fields, *foreign_keys]),
             ');',
         ])
@@ -99,8 +307,193 @@ class TableFieldPair:
     table: object
     field: object
 
+    def get_alias(self):
+        return f'{self.table.get_name()}_{self.field.get_name()}'
+
+    def get_shape(self):
+        return self.table.get_name(), self.field.get_name()
+
+    def generate_sql_expression(self):
+        return f'{self.table.get_name()}.{self.field.get_name()}'
+
     def generate_sql_select(self):
-        return f'{self.table.get_name()}.{self.field.get_name()} as {self.table.get_name()}_{self.field.get_name()}'
+        return f'{self.table.get_name()}.{self.field.get_name()} as {self.get_alias()}'
+
+
+######################################################################
+#           Predicates
+######################################################################
+
+# A predicate renders an SQL condition w/ `?` placeholders for its values.
+# `column` is a `TableFieldPair`, or any other object providing
+# `generate_sql_expression` and `get_shape`.
+
+
+@dataclasses.dataclass
+class EqPredicate:
+    column: object
+    value: object
+
+    def get_shape(self):
+        return type(self), self.column.get_shape()
+
+    def generate_sql(self):
+        return f'{self.column.generate_sql_expression()} = ?'
+
+    def generate_parameters_iter(self):
+        yield self.value
+
+
+@dataclasses.dataclass
+class RangePredicate:
+    """
+    `lower <= column <= upper`. Either bound may be None
+    """
+    column: object
+    lower: object = None
+    upper: object = None
+    lower_inclusive: bool = True
+    upper_inclusive: bool = True
+
+    def get_shape(self):
+        return type(self), self.column.get_shape(), self.lower is None, self.upper is None, \
+            self.lower_inclusive, self.upper_inclusive
+
+    def generate_sql(self):
+        expression = self.column.generate_sql_expression()
+        conditions = list()
+
+        if self.lower is not None:
+            conditions.append(f'{expression} {">=" if self.lower_inclusive else ">"} ?')
+
+        if self.upper is not None:
+            conditions.append(f'{expression} {"<=" if self.upper_inclusive else "<"} ?')
+
+        assert len(conditions), "At least one bound is expected"
+
+        return ' AND '.join(conditions)
+
+    def generate_parameters_iter(self):
+        if self.lower is not None:
+            yield self.lower
+
+        if self.upper is not None:
+            yield self.upper
+
+
+@dataclasses.dataclass
+class InPredicate:
+    column: object
+    values: list
+
+    def get_shape(self):
+        return type(self), self.column.get_shape(), len(self.values)
+
+    def generate_sql(self):
+        return f'{self.column.generate_sql_expression()} in ({", ".join("?" * len(self.values))})'
+
+    def generate_parameters_iter(self):
+        yield from self.values
+
+
+@dataclasses.dataclass
+class LikePredicate:
+    """
+    `pattern` uses SQL "like" wildcards: `%` and `_`
+    """
+    column: object
+    pattern: str
+    escape: str = None
+
+    def get_shape(self):
+        return type(self), self.column.get_shape(), self.escape is None
+
+    def generate_sql(self):
+        escape = '' if self.escape is None else ' escape ?'
+
+        return f'{self.column.generate_sql_expression()} like ?{escape}'
+
+    def generate_parameters_iter(self):
+        yield self.pattern
+
+        if self.escape is not None:
+            yield self.escape
+
+
+@dataclasses.dataclass
+class NullPredicate:
+    column: object
+    is_null: bool = True
+
+    def get_shape(self):
+        return type(self), self.column.get_shape(), self.is_null
+
+    def generate_sql(self):
+        return f'{self.column.generate_sql_expression()} is {"" if self.is_null else "not "}null'
+
+    def generate_parameters_iter(self):
+        yield from ()
+
+
+@dataclasses.dataclass
+class OrPredicate:
+    """
+    Holds if any of `predicates` holds
+    """
+    predicates: list
+
+    def __post_init__(self):
+        assert len(self.predicates), "At least one predicate is expected"
+
+    def get_shape(self):
+        return type(self), tuple([i.get_shape() for i in self.predicates])
+
+    def generate_sql(self):
+        return '(' + ' OR '.join(map(lambda i: f'({i.generate_sql()})', self.predicates)) + ')'
+
+    def generate_parameters_iter(self):
+        for predicate in self.predicates:
+            yield from predicate.generate_parameters_iter()
+
+
+@dataclasses.dataclass
+class AndPredicate:
+    """
+    Holds if all of `predicates` hold. Is useful inside `OrPredicate`
+    """
+    predicates: list
+
+    def __post_init__(self):
+        assert len(self.predicates), "At least one predicate is expected"
+
+    def get_shape(self):
+        return type(self), tuple([i.get_shape() for i in self.predicates])
+
+    def generate_sql(self):
+        return '(' + ' AND '.join(map(lambda i: f'({i.generate_sql()})', self.predicates)) + ')'
+
+    def generate_parameters_iter(self):
+        for predicate in self.predicates:
+            yield from predicate.generate_parameters_iter()
+
+
+def _generate_sql_inner_join_iter(inner_joins):
+    """
+    `inner_joins` is an iterable of (parent table name, child table name)
+    """
+    for parent_table_name, child_table_name in inner_joins:
+        child_id_field_name = parent_table_name + "_" + "id"  # See `ForeignIdField`
+        yield f'inner join {parent_table_name} on {parent_table_name}.id = {child_table_name}.{child_id_field_name}'
+
+
+def _generate_sql_limit_iter(limit, offset):
+    if limit is not None:
+        yield 'limit ?'
+    elif offset is not None:
+        yield 'limit -1'
+
+    if offset is not None:
+        yield 'offset ?'
 
 
 @dataclasses.dataclass
@@ -122,8 +515,13 @@ class InnerJoinSelectQuery:
 
     def __post_init__(self):
         self._table_fields = list()
-        self._eq_constraints = list()
-        self._inner_joins = list()
+        self._constraints = list()
+        self._inner_joins = dict()  # (parent table name, child table name) -> None, ordered set
+        self._order_by = list()
+        self._limit = None
+        self._offset = None
+        self._keyset_after_id = None
+        self._keyset_page_size = None
 
     def add_parent_table_field(self, parent_table, parent_table_field, child_table):
         """
@@ -131,13 +529,7 @@ class InnerJoinSelectQuery:
         is made for
         """
         # Make inner join query
-        child_id_field_name = ForeignIdField(parent_table).get_name()
-        child_table_name = child_table.get_name()
-        parent_table_name = parent_table.get_name()
-        join_query = f'inner join {parent_table.get_name()} on {parent_table_name}.id = {child_table_name}.{child_id_field_name}'
-
-        if join_query not in self._inner_joins:
-            self._inner_joins += [join_query]
+        self._inner_joins[(parent_table.get_name(), child_table.get_name())] = None
 
         # Add field
         self._table_fields.append(TableFieldPair(parent_table, parent_table_field))
@@ -152,19 +544,122 @@ class InnerJoinSelectQuery:
         """
         self._table_fields.append(TableFieldPair(self.table, field))
 
+    def add_constraint(self, predicate):
+        """
+        Adds a predicate (see `EqPredicate`, `OrPredicate`, etc.). All the
+        constraints are "AND"ed.
+        """
+        self._constraints.append(predicate)
+
     def add_eq_constraint(self, table1, field1, value):
-        self._eq_constraints.append((table1, field1, value))
+        self.add_constraint(EqPredicate(TableFieldPair(table1, field1), value))
+
+    def add_range_constraint(self, table, field, lower=None, upper=None, lower_inclusive=True, upper_inclusive=True):
+        self.add_constraint(RangePredicate(TableFieldPair(table, field), lower, upper, lower_inclusive,
+            upper_inclusive))
+
+    def add_in_constraint(self, table, field, values):
+        self.add_constraint(InPredicate(TableFieldPair(table, field), list(values)))
+
+    def add_like_constraint(self, table, field, pattern, escape=None):
+        self.add_constraint(LikePredicate(TableFieldPair(table, field), pattern, escape))
+
+    def add_null_constraint(self, table, field, is_null=True):
+        self.add_constraint(NullPredicate(TableFieldPair(table, field), is_null))
+
+    def add_order_by(self, table, field, descending=False):
+        """
+        Orderings are applied in the same order as they have been added
+        """
+        self._order_by.append((TableFieldPair(table, field), descending))
+
+    def set_limit(self, limit=None, offset=None):
+        """
+        Pass None to disable either. Deep offsets are slow, as SQLite still
+        steps over the skipped rows, see `set_keyset_page`
+        """
+        self._limit = limit
+        self._offset = offset
+
+    def set_keyset_page(self, after_id=None, page_size=None):
+        """
+        Limits the query to `page_size` rows w/ `id > after_id`, ordered by
+        `id` of `self.table`. Unlike "offset", each page is an index lookup,
+        no matter how deep into the table it is. Pass None to disable
+        either. Takes precedence over `add_order_by` and `set_limit`.
+        """
+        self._keyset_after_id = after_id
+        self._keyset_page_size = page_size
+
+    def get_row_type(self):
+        """
+        Row type for mapped results (see `Db.execute`). A namedtuple w/
+        attributes named after column aliases, e.g. `row.parent_name`.
+        """
+        return _make_row_type(tuple(map(lambda i: i.get_alias(), self._table_fields)))
+
+    def get_table_names(self):
+        """
+        Names of all the tables the query reads from
+        """
+        return (self.table.get_name(), *{i[0]: None for i in self._inner_joins})
+
+    def get_field_types(self):
+        """
+        Python types of the queried fields, `int` or `str`
+        """
+        return list(map(lambda i: i.field.field_type, self._table_fields))
+
+    def get_id_field_index(self):
+        """
+        Position of `self.table`'s "id" among the queried fields, or None
+        """
+        for i, table_field in enumerate(self._table_fields):
+            if table_field.table.get_name() == self.table.get_name() and type(table_field.field) is IdField:
+                return i
+
+        return None
 
     def _generate_sql_field_query_iter(self):
         yield from map(lambda i: i.generate_sql_select(), self._table_fields)
 
     def _generate_sql_inner_join_iter(self):
-        for join in self._inner_joins:
-            yield join
+        yield from _generate_sql_inner_join_iter(self._inner_joins)
 
-    def _generate_sql_eq_constraints(self):
-            for t1, f1, v in self._eq_constraints:
-                yield f'{t1.get_name()}.{f1.get_name()} = "{v}"'
+    def _generate_sql_constraints(self):
+        yield from map(lambda i: i.generate_sql(), self._constraints)
+
+        if self._keyset_after_id is not None:
+            yield f'{self.table.get_name()}.id > ?'
+
+    def _generate_sql_order_by_iter(self):
+        if self._keyset_page_size is not None:
+            yield f'{self.table.get_name()}.id'
+        else:
+            for column, descending in self._order_by:
+                yield column.generate_sql_expression() + (' desc' if descending else '')
+
+    def _generate_sql_limit_iter(self):
+        if self._keyset_page_size is not None:
+            yield 'limit ?'
+        else:
+            yield from _generate_sql_limit_iter(self._limit, self._offset)
+
+    def _generate_sql_parameters_iter(self):
+        for predicate in self._constraints:
+            yield from predicate.generate_parameters_iter()
+
+        if self._keyset_after_id is not None:
+            yield self._keyset_after_id
+
+        if self._keyset_page_size is not None:
+            yield self._keyset_page_size
+        else:
+            if self._limit is not None:
+                yield self._limit
+
+            if self._offset is not None:
+                yield self._offset
 
     def _generate_sql_select_iter(self):
         yield "select"
@@ -172,97 +667,467 @@ class InnerJoinSelectQuery:
         yield 'from'
         yield self.table.get_name()
         yield from self._generate_sql_inner_join_iter()
-        if len(self._eq_constraints):
+        constraints = list(self._generate_sql_constraints())
+        if len(constraints):
             yield 'where'
-            yield ' AND '.join(self._generate_sql_eq_constraints())
+            yield ' AND '.join(constraints)
+        order_by = list(self._generate_sql_order_by_iter())
+        if len(order_by):
+            yield 'order by'
+            yield ', '.join(order_by)
+        yield from self._generate_sql_limit_iter()
         yield ';'
 
+    def _generate_shape(self):
+        return (
+            type(self),
+            self.table.get_name(),
+            tuple([(i.table.get_name(), i.field.get_name()) for i in self._table_fields]),
+            tuple(self._inner_joins),
+            tuple([i.get_shape() for i in self._constraints]),
+            tuple([(i.get_shape(), descending) for i, descending in self._order_by]),
+            self._limit is not None,
+            self._offset is not None,
+            self._keyset_after_id is not None,
+            self._keyset_page_size is not None,
+        )
+
+    def generate_sql_parameterized(self):
+        """
+        Returns `(sql, parameters)`, where values are replaced w/ `?`
+        placeholders, so queries of the same shape share a prepared statement
+        (and the SQL text, see `SqlShapeCache`)
+        """
+        sql = SQL_SHAPE_CACHE.get(self._generate_shape(), lambda: ' '.join(self._generate_sql_select_iter()))
+
+        return sql, list(self._generate_sql_parameters_iter())
+
     def generate_sql_select(self):
-        return ' '.join(self._generate_sql_select_iter())
+        return _inline_sql_parameters(*self.generate_sql_parameterized())
 
     def generate_sql(self):
-        return ' '.join(self._generate_sql_select_iter())
+        return self.generate_sql_select()
+
+
+AGGREGATE_FUNCTIONS = ["count", "sum", "total", "min", "max", "avg", "group_concat"]
 
 
 @dataclasses.dataclass
-class UpdateQuery:
-    table: object
+class Aggregate:
+    """
+    An aggregate function over a column (`TableFieldPair`). If `column` is
+    None, it is `count(*)`. May be used as a predicate's column in "having"
+    constraints, and in orderings.
+    """
+    function: str
+    column: object = None
+    distinct: bool = False
 
-    def __post_init__(self):
-        self._eq_constraints = list()
-        self._value_mappings = list()
+    alias: str = None
+    """
+    Generated from the function and column names, if None
+    """
 
-    def add_field(self, field, value):
-        self._value_mappings += [(field.get_name(), value)]
+    def __post_init__(self):
+        assert self.function in AGGREGATE_FUNCTIONS
+        assert self.column is not None or self.function == "count"
 
-    def add_eq_constraint(self, field, value):
-        self._eq_constraints += [(field.get_name(), value)]
+    def get_alias(self):
+        if self.alias is not None:
+            return self.alias
+        elif self.column is None:
+            return self.function
 
-    def generate_sql(self):
-        out = ' '.join([
-            'UPDATE',
-            self.table.get_name(),
-            'SET',
-            ','.join([f"{f}='{v}'" for f, v in self._value_mappings]),
-            'WHERE',
-            ' AND '.join([f'{f}={v}' for f, v in self._eq_constraints]),
-            ';'
-        ])
+        return f'{self.function}_{self.column.get_alias()}'
 
-        return out
+    def get_shape(self):
+        return self.function, None if self.column is None else self.column.get_shape(), self.distinct, self.alias
 
+    def generate_sql_expression(self):
+        if self.column is None:
+            return f'{self.function}(*)'
 
-@dataclasses.dataclass
-class DeleteQuery:
-    table: object
-    identifier: int
+        distinct = 'distinct ' if self.distinct else ''
 
-    def generate_sql(self):
-        out = f'DELETE FROM {self.table.get_name()} where {self.table.get_name()}.id = {self.identifier}'
+        return f'{self.function}({distinct}{self.column.generate_sql_expression()})'
 
-        return out
+    def generate_sql_select(self):
+        return f'{self.generate_sql_expression()} as {self.get_alias()}'
 
 
 @dataclasses.dataclass
-class InsertQuery:
+class AggregateQuery:
     """
-    Encapsulates an SQL "insert" query.
+    Computes aggregates (see `Aggregate`) over rows of the table, optionally
+    grouped. Resulting columns go in the exact order as they have been
+    added through `add_group_by` and `add_aggregate`. Parent tables are
+    joined the same way as in `InnerJoinSelectQuery`.
+
+    Rows are filtered before grouping by `add_constraint` ("where"), and
+    groups after it by `add_having_constraint` ("having").
     """
 
     table: object
-    """ The table that is being inserted into """
+    """
+    The table that is being queried
+    """
 
     def __post_init__(self):
-        self._field_names = list()
-        self._values = list()
-
-    def add_value(self, field, value):
+        self._columns = list()
+        self._group_by = list()
+        self._constraints = list()
+        self._having_constraints = list()
+        self._inner_joins = dict()  # (parent table name, child table name) -> None, ordered set
+        self._order_by = list()
+        self._limit = None
+        self._offset = None
+
+    def add_parent_table_join(self, parent_table, child_table):
         """
-        Adds a (field, value) pair into the query.
+        Makes fields of the parent table available for grouping, aggregates,
+        and constraints. The parent table might be a few tables away from the
+        table the query is made for
+        """
+        self._inner_joins[(parent_table.get_name(), child_table.get_name())] = None
 
-        WARNING: please note that if a field does not have a default value, all
-        of its fields MUST BE added in the query.
+    def add_group_by(self, table, field):
+        """
+        Groups by the field, which is also added to the result
+        """
+        column = TableFieldPair(table, field)
+        self._columns.append(column)
+        self._group_by.append(column)
 
-        WARNING: The "id" field MUST NOT be included.
+    def add_aggregate(self, function, table=None, field=None, distinct=False, alias=None):
+        """
+        E.g. `add_aggregate("count")`, or `add_aggregate("sum", table, field)`.
+        Returns the `Aggregate`, so it can be used in "having" constraints
         """
+        column = None if field is None else TableFieldPair(table, field)
+        aggregate = Aggregate(function, column, distinct, alias)
+        self._columns.append(aggregate)
 
-        if type(value) is str:
-            value = f"'{value}'"
-        elif type(value) is int:
-            value = str(value)
+        return aggregate
 
-        self._field_names.append(field.get_name())
-        self._values.append(value)
+    def add_constraint(self, predicate):
+        self._constraints.append(predicate)
 
-    def generate_sql_insert(self):
-        columns = ', '.join(self._field_names)
-        values = ', '.join(self._values)
-        return f'insert into {self.table.get_name()} ({columns}) values({values});'
+    def add_eq_constraint(self, table, field, value):
+        self.add_constraint(EqPredicate(TableFieldPair(table, field), value))
+
+    def add_having_constraint(self, predicate):
+        """
+        A predicate on an `Aggregate`, e.g.
+        `RangePredicate(query.add_aggregate("count"), lower=10)`
+        """
+        self._having_constraints.append(predicate)
+
+    def add_order_by(self, column, descending=False):
+        """
+        `column` is either `Aggregate`, or `TableFieldPair`
+        """
+        self._order_by.append((column, descending))
+
+    def set_limit(self, limit=None, offset=None):
+        self._limit = limit
+        self._offset = offset
+
+    def get_row_type(self):
+        """
+        See `InnerJoinSelectQuery.get_row_type`
+        """
+        return _make_row_type(tuple(map(lambda i: i.get_alias(), self._columns)))
+
+    def get_table_names(self):
+        """
+        See `InnerJoinSelectQuery.get_table_names`
+        """
+        return (self.table.get_name(), *{i[0]: None for i in self._inner_joins})
+
+    def _generate_sql_select_iter(self):
+        yield "select"
+        yield ', '.join(map(lambda i: i.generate_sql_select(), self._columns))
+        yield 'from'
+        yield self.table.get_name()
+        yield from _generate_sql_inner_join_iter(self._inner_joins)
+        if len(self._constraints):
+            yield 'where'
+            yield ' AND '.join(map(lambda i: i.generate_sql(), self._constraints))
+        if len(self._group_by):
+            yield 'group by'
+            yield ', '.join(map(lambda i: i.generate_sql_expression(), self._group_by))
+        if len(self._having_constraints):
+            yield 'having'
+            yield ' AND '.join(map(lambda i: i.generate_sql(), self._having_constraints))
+        if len(self._order_by):
+            yield 'order by'
+            yield ', '.join(map(lambda i: i[0].generate_sql_expression() + (' desc' if i[1] else ''), self._order_by))
+        yield from _generate_sql_limit_iter(self._limit, self._offset)
+        yield ';'
+
+    def _generate_sql_parameters_iter(self):
+        for predicate in [*self._constraints, *self._having_constraints]:
+            yield from predicate.generate_parameters_iter()
+
+        if self._limit is not None:
+            yield self._limit
+
+        if self._offset is not None:
+            yield self._offset
+
+    def _generate_shape(self):
+        return (
+            type(self),
+            self.table.get_name(),
+            tuple([(type(i), i.get_shape()) for i in self._columns]),
+            tuple([i.get_shape() for i in self._group_by]),
+            tuple(self._inner_joins),
+            tuple([i.get_shape() for i in self._constraints]),
+            tuple([i.get_shape() for i in self._having_constraints]),
+            tuple([(i.get_shape(), descending) for i, descending in self._order_by]),
+            self._limit is not None,
+            self._offset is not None,
+        )
+
+    def generate_sql_parameterized(self):
+        sql = SQL_SHAPE_CACHE.get(self._generate_shape(), lambda: ' '.join(self._generate_sql_select_iter()))
+
+        return sql, list(self._generate_sql_parameters_iter())
+
+    def generate_sql(self):
+        return _inline_sql_parameters(*self.generate_sql_parameterized())
+
+
+@dataclasses.dataclass
+class UpdateQuery:
+    """
+    Updates all rows matching the constraints. There MUST be at least one
+    constraint.
+    """
+    table: object
+
+    def __post_init__(self):
+        self._eq_constraints = list()
+        self._constraints = list()
+        self._value_mappings = list()
+
+    def add_field(self, field, value):
+        self._value_mappings += [(field.get_name(), value)]
+
+    def add_eq_constraint(self, field, value):
+        self._eq_constraints += [(field.get_name(), value)]
+
+    def add_constraint(self, predicate):
+        """
+        See `InnerJoinSelectQuery.add_constraint`. Columns MUST belong to
+        `self.table`
+        """
+        self._constraints.append(predicate)
+
+    def generate_sql_parameterized(self):
+        constraints = [f'{f}=?' for f, _ in self._eq_constraints] + [i.generate_sql() for i in self._constraints]
+        assert len(constraints), "Updating all rows is not supported"
+        out = ' '.join([
+            'UPDATE',
+            self.table.get_name(),
+            'SET',
+            ','.join([f"{f}=?" for f, _ in self._value_mappings]),
+            'WHERE',
+            ' AND '.join(constraints),
+            ';'
+        ])
+        parameters = [v for _, v in self._value_mappings] + [v for _, v in self._eq_constraints]
+
+        for predicate in self._constraints:
+            parameters.extend(predicate.generate_parameters_iter())
+
+        return out, parameters
+
+    def generate_sql(self):
+        return _inline_sql_parameters(*self.generate_sql_parameterized())
+
+
+@dataclasses.dataclass
+class DeleteQuery:
+    """
+    Deletes the row w/ id `identifier`, and/or all rows matching constraints.
+    There MUST be at least one of those.
+    """
+    table: object
+    identifier: int = None
+
+    def __post_init__(self):
+        self._constraints = list()
+
+    def add_constraint(self, predicate):
+        """
+        See `InnerJoinSelectQuery.add_constraint`. Columns MUST belong to
+        `self.table`
+        """
+        self._constraints.append(predicate)
+
+    def generate_sql_parameterized(self):
+        constraints = [i.generate_sql() for i in self._constraints]
+        parameters = list()
+
+        if self.identifier is not None:
+            constraints.insert(0, f'{self.table.get_name()}.id = ?')
+            parameters.append(self.identifier)
+
+        assert len(constraints), "Deleting all rows is not supported"
+        out = f'DELETE FROM {self.table.get_name()} where {" AND ".join(constraints)}'
+
+        for predicate in self._constraints:
+            parameters.extend(predicate.generate_parameters_iter())
+
+        return out, parameters
+
+    def generate_sql(self):
+        return _inline_sql_parameters(*self.generate_sql_parameterized())
+
+
+@dataclasses.dataclass
+class InsertQuery:
+    """
+    Encapsulates an SQL "insert" query.
+    """
+
+    table: object
+    """ The table that is being inserted into """
+
+    def __post_init__(self):
+        self._field_names = list()
+        self._values = list()
+
+    def add_value(self, field, value):
+        """
+        Adds a (field, value) pair into the query.
+
+        WARNING: please note that if a field does not have a default value, all
+        of its fields MUST BE added in the query.
+
+        WARNING: The "id" field MUST NOT be included.
+        """
+        self._field_names.append(field.get_name())
+        self._values.append(value)
+
+    def _generate_sql_on_conflict(self):
+        return ''
+
+    def generate_sql_parameterized(self):
+        columns = ', '.join(self._field_names)
+        placeholders = ', '.join('?' * len(self._values))
+        on_conflict = self._generate_sql_on_conflict()
+
+        return f'insert into {self.table.get_name()} ({columns}) values({placeholders}){on_conflict};', \
+            list(self._values)
+
+    def generate_sql_insert(self):
+        return _inline_sql_parameters(*self.generate_sql_parameterized())
 
     def generate_sql(self):
         return self.generate_sql_insert()
 
 
+@dataclasses.dataclass
+class BulkInsertQuery:
+    """
+    Encapsulates an SQL "insert" query for many rows at once. Columns are
+    declared w/ `add_field`, each row is a sequence of values in the same
+    order. Rows are streamed, so generators are consumed lazily (and only
+    once). Use w/ `Db.execute_many`.
+    """
+
+    table: object
+    """ The table that is being inserted into """
+
+    def __post_init__(self):
+        self._field_names = list()
+        self._row_sources = list()
+
+    def add_field(self, field):
+        """
+        WARNING: The "id" field MUST NOT be included.
+        """
+        self._field_names.append(field.get_name())
+
+    def add_row(self, values):
+        self._row_sources.append((values,))
+
+    def add_rows(self, rows):
+        """
+        `rows` is an iterable (list, generator, etc.) of value sequences
+        """
+        self._row_sources.append(rows)
+
+    def generate_sql_parameterized_many(self):
+        """
+        Returns `(sql, rows)`, where `rows` is an iterator over parameter
+        sequences for `executemany`
+        """
+        columns = ', '.join(self._field_names)
+        placeholders = ', '.join('?' * len(self._field_names))
+        on_conflict = self._generate_sql_on_conflict()
+        sql = f'insert into {self.table.get_name()} ({columns}) values({placeholders}){on_conflict};'
+
+        return sql, itertools.chain.from_iterable(self._row_sources)
+
+    def _generate_sql_on_conflict(self):
+        return ''
+
+    def generate_sql(self):
+        sql, rows = self.generate_sql_parameterized_many()
+
+        return '\n'.join(map(lambda i: _inline_sql_parameters(sql, list(i)), rows))
+
+
+def _generate_sql_on_conflict_update(field_names, conflict_fields):
+    conflict_field_names = list(map(lambda i: i.get_name(), conflict_fields))
+    update_field_names = [i for i in field_names if i not in conflict_field_names]
+
+    if not len(update_field_names):
+        return f' on conflict ({", ".join(conflict_field_names)}) do nothing'
+
+    assignments = ', '.join(map(lambda i: f'{i} = excluded.{i}', update_field_names))
+
+    return f' on conflict ({", ".join(conflict_field_names)}) do update set {assignments}'
+
+
+@dataclasses.dataclass
+class UpsertQuery(InsertQuery):
+    """
+    Inserts a row, or, if it conflicts w/ an existing one on
+    `conflict_fields`, updates the rest of the fields of the existing row.
+    `conflict_fields` MUST be covered by a unique index (see `Index`), or be
+    the "id" field.
+    """
+
+    conflict_fields: list
+
+    def __post_init__(self):
+        InsertQuery.__post_init__(self)
+        assert len(self.conflict_fields), "At least one conflict field is expected"
+
+    def _generate_sql_on_conflict(self):
+        return _generate_sql_on_conflict_update(self._field_names, self.conflict_fields)
+
+
+@dataclasses.dataclass
+class BulkUpsertQuery(BulkInsertQuery):
+    """
+    `UpsertQuery` for many rows, see `BulkInsertQuery`
+    """
+
+    conflict_fields: list
+
+    def __post_init__(self):
+        BulkInsertQuery.__post_init__(self)
+        assert len(self.conflict_fields), "At least one conflict field is expected"
+
+    def _generate_sql_on_conflict(self):
+        return _generate_sql_on_conflict_update(self._field_names, self.conflict_fields)
+
+
 class GenerateDbScript:
     """
     Creates a script for generating a stub for the database. Usually, it is
@@ -279,7 +1144,8 @@ class GenerateDbScript:
     def generate_sql_script(self):
         return '\n'.join([
             'pragma foreign_keys = ON;',
-            *list(map(lambda i: i.generate_sql_create(), self._tables))
+            *list(map(lambda i: i.generate_sql_create(), self._tables)),
+            *filter(len, map(lambda i: i.generate_sql_create_indices(), self._tables)),
         ])
 
 
@@ -290,6 +1156,9 @@ class Transaction:
     def add_query(self, query):
         self._queries.append(query)
 
+    def get_queries(self):
+        return self._queries
+
     def generate_sql_script(self):
         result = list()
         result.append("BEGIN TRANSACTION;")
@@ -298,34 +1167,1609 @@ class Transaction:
         return '\n'.join(result)
 
 
-class Db:
+DATA_FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+}
+"""
+File suffix -> format for `Db.import_rows` and `Db.export_rows`
+"""
+
+
+def _get_data_format(path, data_format):
+    if data_format is None:
+        data_format = DATA_FORMATS.get(pathlib.Path(path).suffix.lower())
+
+    assert data_format in DATA_FORMATS.values(), f'Unknown data format of "{path}"'
+
+    return data_format
+
+
+def _read_records(file, data_format):
     """
-    Opens/creates a database file, and provides an API for executing *Queries*
-    and *Scripts*. The difference b/w the two is that queries MAY return
-    resulting fields, and CAN contain ONLY one SQL sentence.
+    Returns `(column names, iterator of rows)`, the rows are aligned w/ the
+    names
     """
-    def __init__(self, tables: list = None):
-        self._tables = tables
+    if data_format == "csv":
+        reader = csv.reader(file)
 
-    def execute(self, query):
-        cur = self._conn.cursor()
-        sql = query.generate_sql()
-        try:
-            cur.execute(query.generate_sql())
-            self._conn.commit()
-        except sqlite3.OperationalError as e:
-            tired.logging.error(f"Failed to execute query: {sql}: {e}")
-            raise e
+        return next(reader, []), reader
 
-        return cur.fetchall()
+    objects = map(json.loads, filter(str.strip, file))
+    first = next(objects, None)
 
-    def execute_query(self, query):
-        return self.execute(query)
+    if first is None:
+        return [], iter(())
 
-    def execute_script(self, script):
-        self._conn.cursor().executescript(script.generate_sql_script())
-        self._conn.commit()
+    names = list(first)
 
-    def connect(self, filename):
-        tired.logging.info(f'Trying to connect w/ the database "{filename}"')
-        self._conn = sqlite3.connect(filename)
+    return names, map(lambda i: [i.get(name) for name in names], itertools.chain([first], objects))
+
+
+def _make_field_converter(field):
+    """
+    CSV has no NULLs, empty values are read as NULLs for integer fields, and
+    as empty strings for text ones
+    """
+    field_type = field.field_type
+
+    def convert(value):
+        if value is None or (value == '' and field_type is int):
+            return None
+
+        return field_type(value)
+
+    return convert
+
+
+def _log_throughput(action, n_rows, time_start):
+    duration = time.perf_counter() - time_start
+    tired.logging.info(f"{action}: {n_rows} rows in {duration:.2f} s, {n_rows / max(duration, 1e-9):.0f} rows/s")
+
+
+def print_backup_progress(n_copied_pages, n_pages):
+    """
+    Progress callback for `Db.backup` and `Db.restore`
+    """
+    if n_pages == 0:
+        # An empty database is copied at once
+        n_copied_pages, n_pages = 1, 1
+
+    tired.ui.print_progress(n_copied_pages, n_pages, units='%', title="Copying the database:")
+
+    if n_copied_pages == n_pages:
+        print()
+
+
+def _make_backup_progress(progress, on_step=None):
+    """
+    Adapts `progress(n_copied_pages, n_pages)` to `sqlite3.Connection.backup`
+    """
+    def backup_progress(status, remaining, total):
+        if progress is not None:
+            progress(total - remaining, total)
+
+        if on_step is not None:
+            on_step()
+
+    return backup_progress
+
+
+def _is_read_query(query):
+    """
+    Read queries may be run on reader connections of a pooled `Db`
+    """
+    return isinstance(query, (InnerJoinSelectQuery, AggregateQuery))
+
+
+TRANSACTION_MODES = ["deferred", "immediate", "exclusive"]
+
+PRAGMA_PROFILES = {
+    # Survives power loss after each commit
+    "durable": {
+        "page_size": 4096,
+        "journal_mode": "wal",
+        "synchronous": 2,  # FULL
+        "cache_size": -16384,  # KiB
+        "mmap_size": 0,
+        "temp_store": 0,  # DEFAULT
+    },
+    # Initial population. A crash mid-load MAY corrupt the database
+    "bulk-load": {
+        "page_size": 16384,
+        "journal_mode": "memory",
+        "synchronous": 0,  # OFF
+        "cache_size": -262144,
+        "mmap_size": 0,
+        "temp_store": 2,  # MEMORY
+    },
+    # Serving lookups and joins. Survives application crashes, a power loss
+    # MAY roll back the latest commits
+    "read-mostly": {
+        "page_size": 4096,
+        "journal_mode": "wal",
+        "synchronous": 1,  # NORMAL
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": 2,
+    },
+}
+"""
+Named sets of pragmas for `Db.connect`. The order matters: `page_size` MUST
+be set before the journal mode is switched to WAL.
+"""
+
+_CONNECTION_PRAGMAS = ["cache_size", "mmap_size", "temp_store"]
+"""
+Pragmas that apply to a particular connection, as opposed to the database
+file. Only those are applied to read-only connections.
+"""
+
+
+def _apply_pragmas(connection, pragmas):
+    """
+    Applies, and then reads back each pragma. Values that did not take effect
+    (e.g. `page_size` of an already populated database, or `mmap_size` above
+    the compile-time limit) are reported. Returns the actual values.
+    """
+    result = dict()
+
+    for name, value in pragmas.items():
+        connection.execute(f"pragma {name} = {value}")
+        row = connection.execute(f"pragma {name}").fetchone()
+        result[name] = None if row is None else row[0]  # Not applicable, e.g. `mmap_size` of ":memory:"
+
+        if str(result[name]).lower() != str(value).lower():
+            tired.logging.warning(f'pragma {name}: requested {value}, got {result[name]}')
+
+    return result
+
+
+class StrColumn:
+    """
+    A column of strings packed into one UTF-8 buffer, see
+    `Db.execute_columnar`. The i-th string is
+    `data[offsets[i]:offsets[i + 1]]`.
+    """
+
+    def __init__(self):
+        self.offsets = array.array('q', [0])
+        self.data = bytearray()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        index = range(len(self))[index]
+
+        return self.data[self.offsets[index]:self.offsets[index + 1]].decode()
+
+    def extend(self, strings):
+        encoded = [i.encode() for i in strings]
+        self.offsets.extend(itertools.islice(itertools.accumulate(
+            itertools.chain([self.offsets[-1]], map(len, encoded))), 1, None))
+        self.data += b''.join(encoded)
+
+    def to_list(self):
+        return list(map(self.__getitem__, range(len(self))))
+
+    def to_numpy(self, max_padding=4):
+        """
+        NumPy array of fixed-width strings (`<U` dtype), built from the
+        buffer w/o making a `str` per row. As w/ any `<U` array, trailing
+        NUL characters are dropped.
+
+        Every row takes as much memory as the longest string. If that is
+        more than `max_padding` times the size of the strings themselves
+        (e.g. one long string among short ones), an `object` array of `str`
+        is returned instead.
+        """
+        import numpy
+
+        text = numpy.frombuffer(self.data, dtype=numpy.uint8)
+        char_offsets = numpy.frombuffer(self.offsets, dtype=numpy.int64)
+
+        if len(text) and text.max() >= 0x80:
+            # The whole buffer is decoded at once, offsets are converted
+            # from bytes to characters by subtracting UTF-8 continuation
+            # bytes before them
+            continuations = numpy.flatnonzero((text & 0xc0) == 0x80)
+            char_offsets = char_offsets - numpy.searchsorted(continuations, char_offsets)
+            text = numpy.frombuffer(self.data.decode().encode("utf-32-le"), dtype=numpy.uint32)
+
+        lengths = numpy.diff(char_offsets)
+        width = max(1, int(lengths.max(initial=0)))
+
+        if width * len(self) > max_padding * max(len(text), len(self)):
+            result = numpy.empty(len(self), dtype=object)
+
+            for i in range(len(self)):
+                result[i] = self[i]
+
+            return result
+
+        # Strings are contiguous in `text`, so it is scattered into the rows
+        # a block at a time (bounding the index arrays): the i-th string
+        # starts at `i * width` in `chars`
+        chars = numpy.zeros(len(self) * width, dtype=numpy.uint32)
+        shifts = numpy.arange(len(self)) * width - char_offsets[:-1]
+        block_size = 2 ** 16
+
+        for begin in range(0, len(self), block_size):
+            end = min(begin + block_size, len(self))
+            index = numpy.repeat(shifts[begin:end], lengths[begin:end])
+            index += numpy.arange(char_offsets[begin], char_offsets[end])
+            chars[index] = text[char_offsets[begin]:char_offsets[end]]
+
+        return chars.view(f'<U{width}')
+
+
+@dataclasses.dataclass
+class QueryStats:
+    """
+    Accumulated statistics of one query shape, i.e. SQL text
+    """
+    sql: str
+    n_calls: int = 0
+    n_rows: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+    query_plan: list = None
+    """
+    `EXPLAIN QUERY PLAN` details, captured the first time the query is slow
+    """
+
+    is_full_scan: bool = False
+    """
+    The plan contains a "SCAN" of a table w/o an index
+    """
+
+
+def _is_full_scan(query_plan_detail):
+    return query_plan_detail.startswith("SCAN ") and " INDEX " not in query_plan_detail \
+        and "CONSTANT ROW" not in query_plan_detail
+
+
+class QueryProfiler:
+    """
+    Opt-in instrumentation for `Db` (see `Db.set_profiler`). Records the call
+    count, wall time, and the number of returned (or affected) rows per query
+    shape. Queries taking `slow_query_threshold` seconds or longer are
+    logged, and get their query plan captured.
+
+    To dump the summary at shutdown:
+
+    ```
+    atexit.register(profiler.log_report)
+    ```
+    """
+
+    def __init__(self, slow_query_threshold=0.1):
+        self._slow_query_threshold = slow_query_threshold
+        self._stats = dict()
+        self._lock = threading.Lock()
+
+    def record(self, connection, sql, parameters, duration, n_rows):
+        """
+        Is called by `Db` w/ the connection the query has been run on
+        """
+        with self._lock:
+            stats = self._stats.get(sql)
+
+            if stats is None:
+                stats = QueryStats(sql)
+                self._stats[sql] = stats
+
+            stats.n_calls += 1
+            stats.n_rows += n_rows
+            stats.total_time += duration
+            stats.max_time = max(stats.max_time, duration)
+            is_plan_required = duration >= self._slow_query_threshold and stats.query_plan is None
+
+            if is_plan_required:
+                stats.query_plan = list()
+
+        if not is_plan_required:
+            return
+
+        try:
+            query_plan = [i[-1] for i in connection.execute("explain query plan " + sql, parameters)]
+        except sqlite3.Error as e:
+            query_plan = [f"unavailable: {e}"]
+
+        stats.query_plan = query_plan
+        stats.is_full_scan = any(map(_is_full_scan, query_plan))
+        tired.logging.warning(f"Slow query ({duration * 1000:.1f} ms, {n_rows} rows): {sql}",
+            "plan:", "; ".join(query_plan))
+
+    def get_stats(self):
+        """
+        List of `QueryStats`, the most time-consuming first
+        """
+        with self._lock:
+            return sorted(map(dataclasses.replace, self._stats.values()), key=lambda i: i.total_time, reverse=True)
+
+    def generate_report(self):
+        lines = ["calls     total,ms  avg,ms    max,ms    rows      scan  sql"]
+
+        for stats in self.get_stats():
+            lines.append(' '.join([
+                f"{stats.n_calls:<9}",
+                f"{stats.total_time * 1000:<9.1f}",
+                f"{stats.total_time * 1000 / stats.n_calls:<9.3f}",
+                f"{stats.max_time * 1000:<9.1f}",
+                f"{stats.n_rows:<9}",
+                f"{'FULL' if stats.is_full_scan else '':<5}",
+                stats.sql,
+            ]))
+
+        return '\n'.join(lines)
+
+    def log_report(self):
+        tired.logging.info("Query profile:\n" + self.generate_report())
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class QueryCache:
+    """
+    Read-through cache of select query results for `Db` (see
+    `Db.set_cache`). Entries are keyed by SQL text (i.e. query shape) and
+    parameters. The least recently used ones are evicted once there are
+    `max_size` of them, and entries expire after `ttl` seconds, unless it is
+    None.
+
+    `Db` invalidates the tables it writes to, along w/ their children, which
+    are affected through "on delete/update cascade". Writes that bypass the
+    `Db` (e.g. other processes) are not seen, `ttl` bounds staleness then.
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = collections.OrderedDict()  # key -> (rows, table names, generations, time)
+        self._generation = 0  # Bumped by `clear()`
+        self._table_generations = dict()  # table name -> number of invalidations
+        self._lock = threading.Lock()
+        self.n_hits = 0
+        self.n_misses = 0
+        self.n_evictions = 0
+
+    def _get_generations(self, table_names):
+        return (self._generation, *[self._table_generations.get(i, 0) for i in table_names])
+
+    def get_generations(self, table_names):
+        """
+        Snapshot to be taken before running a query, and passed to `put()`.
+        If the tables get invalidated in the meantime, the entry is stale
+        from the start.
+        """
+        with self._lock:
+            return self._get_generations(table_names)
+
+    def get(self, key):
+        """
+        Returns cached rows, or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                rows, table_names, generations, time_stored = entry
+
+                if generations == self._get_generations(table_names) \
+                        and (self._ttl is None or time.monotonic() - time_stored < self._ttl):
+                    self._entries.move_to_end(key)
+                    self.n_hits += 1
+
+                    return rows
+
+                del self._entries[key]
+
+            self.n_misses += 1
+
+            return None
+
+    def put(self, key, rows, table_names, generations):
+        with self._lock:
+            self._entries[key] = (rows, table_names, generations, time.monotonic())
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.n_evictions += 1
+
+    def invalidate(self, table_names):
+        with self._lock:
+            for table_name in table_names:
+                self._table_generations[table_name] = self._table_generations.get(table_name, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+
+class Db:
+    """
+    Opens/creates a database file, and provides an API for executing *Queries*
+    and *Scripts*. The difference b/w the two is that queries MAY return
+    resulting fields, and CAN contain ONLY one SQL sentence.
+
+    Outside of `transaction()` scopes, each query is committed on its own.
+
+    A `Db` may be shared b/w threads. There is one writer connection, access
+    to which is serialized. When connected w/ `n_readers > 0`, the database
+    is switched to WAL mode, and read queries are run on a pool of read-only
+    connections, so they neither block, nor are blocked by the writer.
+    """
+    def __init__(self, tables: list = None):
+        self._tables = tables
+        self._transaction_depth = 0
+        self._transaction_thread = None
+        self._writer_lock = threading.RLock()
+        self._readers = queue.Queue()
+        self._n_readers = 0
+        self._profiler = None
+        self._cache = None
+        self._pending_invalidations = set()
+
+    def set_profiler(self, profiler):
+        """
+        Installs a `QueryProfiler`, or removes it, if None
+        """
+        self._profiler = profiler
+
+    def set_cache(self, cache):
+        """
+        Installs a `QueryCache` for `execute`d read queries, or removes it,
+        if None. Reads inside a transaction bypass the cache.
+        """
+        self._cache = cache
+
+    def _generate_cascade_table_names_iter(self, table):
+        """
+        The table, and all the tables referencing it, directly or not
+        """
+        table_names = [table.get_name()]
+        visited = set(table_names)
+
+        while len(table_names):
+            table_name = table_names.pop()
+            yield table_name
+
+            for child in self._tables:
+                for field in child.get_fields():
+                    if type(field) is ForeignIdField and field.parent_table.get_name() == table_name \
+                            and child.get_name() not in visited:
+                        visited.add(child.get_name())
+                        table_names.append(child.get_name())
+
+    def _invalidate(self, table):
+        """
+        Drops cached results affected by a write to the table. Inside a
+        transaction, it is deferred until the end of it, as other connections
+        see the old data until then.
+        """
+        if self._cache is None:
+            return
+
+        if table is None or self._tables is None:
+            table_names = [None]  # Unknown table or relations, everything is dropped
+        else:
+            table_names = list(self._generate_cascade_table_names_iter(table))
+
+        if self._is_in_own_transaction():
+            self._pending_invalidations.update(table_names)
+        else:
+            self._invalidate_table_names(table_names)
+
+    def _invalidate_table_names(self, table_names):
+        if self._cache is None:
+            return
+        elif None in table_names:
+            self._cache.clear()
+        else:
+            self._cache.invalidate(table_names)
+
+    def _record(self, connection, sql, parameters, time_start, n_rows):
+        if self._profiler is not None:
+            self._profiler.record(connection, sql, parameters, time.perf_counter() - time_start, n_rows)
+
+    def _is_in_own_transaction(self):
+        return self._transaction_depth > 0 and self._transaction_thread == threading.get_ident()
+
+    def _is_run_on_reader(self, query):
+        return self._n_readers and _is_read_query(query) and not self._is_in_own_transaction()
+
+    @contextlib.contextmanager
+    def _acquire_connection(self, query):
+        """
+        Hands out a reader connection for the duration of a read query, if
+        there are any. Reads inside a transaction go to the writer, so they
+        see the pending changes.
+        """
+        if self._is_run_on_reader(query):
+            connection = self._readers.get()
+
+            try:
+                yield connection
+            finally:
+                self._readers.put(connection)
+        else:
+            with self._writer_lock:
+                yield self._conn
+
+    def _make_cursor(self, connection, query, mapped):
+        cur = connection.cursor()
+
+        if mapped:
+            cur.row_factory = _make_row_factory(query.get_row_type())
+
+        return cur
+
+    def execute(self, query, mapped=False):
+        """
+        Runs the query w/ bound parameters. Queries of the same shape produce
+        the same SQL text, and hit the connection's prepared statement cache.
+
+        If `mapped` is True, rows are returned as `query.get_row_type()`
+        instances instead of plain tuples.
+        """
+        sql, parameters = _generate_sql_parameterized(query)
+        is_read_query = _is_read_query(query)
+        is_cached = self._cache is not None and is_read_query and not self._is_in_own_transaction()
+
+        if is_cached:
+            key = (sql, tuple(parameters), mapped)
+            rows = self._cache.get(key)
+
+            if rows is not None:
+                return list(rows)
+
+            table_names = query.get_table_names()
+            generations = self._cache.get_generations(table_names)
+
+        with self._acquire_connection(query) as connection:
+            cur = self._make_cursor(connection, query, mapped)
+            time_start = time.perf_counter()
+
+            try:
+                cur.execute(sql, parameters)
+            except sqlite3.OperationalError as e:
+                tired.logging.error(f"Failed to execute query: {sql}: {e}")
+                raise e
+
+            rows = cur.fetchall()
+            self._record(connection, sql, parameters, time_start, len(rows) or max(cur.rowcount, 0))
+
+            if is_cached:
+                self._cache.put(key, tuple(rows), table_names, generations)
+            elif not is_read_query:
+                self._invalidate(getattr(query, "table", None))
+
+            return rows
+
+    def iterate(self, query, batch_size=1000, mapped=False):
+        """
+        Runs the query, and yields resulting rows, fetching them from the
+        cursor `batch_size` rows at a time, so the memory use does not depend
+        on the size of the result.
+
+        A reader connection is held until the generator is exhausted or
+        closed. The writer is only locked while the query is run, and while
+        each batch is fetched, so a suspended generator does not block other
+        threads.
+        """
+        for rows in self._iterate_batches(query, batch_size, mapped):
+            yield from rows
+
+    def _iterate_batches(self, query, batch_size, mapped):
+        """
+        Yields lists of up to `batch_size` rows, see `iterate`
+        """
+        sql, parameters = _generate_sql_parameterized(query)
+
+        if self._is_run_on_reader(query):
+            connection_scope, lock = self._acquire_connection(query), contextlib.nullcontext()
+        else:
+            connection_scope, lock = contextlib.nullcontext(self._conn), self._writer_lock
+
+        with connection_scope as connection:
+            cur = self._make_cursor(connection, query, mapped)
+            time_start = time.perf_counter()
+
+            try:
+                with lock:
+                    cur.execute(sql, parameters)
+            except sqlite3.OperationalError as e:
+                tired.logging.error(f"Failed to execute query: {sql}: {e}")
+                raise e
+
+            # Only the time spent in SQLite is accounted
+            duration = time.perf_counter() - time_start
+            n_rows = 0
+
+            while True:
+                time_start = time.perf_counter()
+
+                with lock:
+                    rows = cur.fetchmany(batch_size)
+
+                duration += time.perf_counter() - time_start
+
+                if not len(rows):
+                    break
+
+                n_rows += len(rows)
+                yield rows
+
+            # Shift the start, so the time spent by the consumer is excluded
+            with lock:
+                self._record(connection, sql, parameters, time.perf_counter() - duration, n_rows)
+
+    def execute_columnar(self, query, batch_size=1000, as_numpy=False):
+        """
+        Runs an `InnerJoinSelectQuery`, and returns the result column by
+        column: a dict of column aliases (see `get_row_type`) to
+        `array('q')` for integer fields, and to `StrColumn` for text ones.
+        Rows are moved from the cursor into the buffers `batch_size` at a
+        time, so the list of all the rows is never built.
+
+        If `as_numpy` is True, NumPy arrays are returned instead: `int64`
+        ones sharing memory w/ the buffers, and ones of strings (see
+        `StrColumn.to_numpy`).
+
+        The columns MUST NOT contain NULLs.
+        """
+        columns = [array.array('q') if i is int else StrColumn() for i in query.get_field_types()]
+
+        for rows in self._iterate_batches(query, batch_size, False):
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+
+        if as_numpy:
+            import numpy
+
+            columns = [numpy.frombuffer(i, dtype=numpy.int64) if type(i) is array.array
+                else i.to_numpy() for i in columns]
+
+        return dict(zip(query.get_row_type()._fields, columns))
+
+    def iterate_keyset(self, query, page_size=1000, after_id=None, mapped=False):
+        """
+        Walks a table in pages of `page_size` rows ordered by "id" (see
+        `InnerJoinSelectQuery.set_keyset_page`), yielding the rows. Each page
+        is a separate query, so no connection is held b/w pages. The query
+        MUST include `query.table`'s "id" field.
+        """
+        id_field_index = query.get_id_field_index()
+        assert id_field_index is not None, "The query must select the table's \"id\" field"
+
+        try:
+            while True:
+                query.set_keyset_page(after_id, page_size)
+                rows = self.execute(query, mapped)
+                yield from rows
+
+                if len(rows) < page_size:
+                    break
+
+                after_id = rows[-1][id_field_index]
+        finally:
+            query.set_keyset_page()
+
+    def execute_many(self, query, chunk_size=1000):
+        """
+        Streams rows of a bulk query (see `BulkInsertQuery`) through
+        `executemany` in chunks of `chunk_size` rows. All the chunks are
+        executed in one transaction, which is committed once at the end, or
+        rolled back on failure. Returns the number of rows.
+        """
+        sql, rows = query.generate_sql_parameterized_many()
+        rows = iter(rows)
+        n_rows = 0
+
+        try:
+            with self.transaction():
+                cur = self._conn.cursor()
+
+                while True:
+                    chunk = list(itertools.islice(rows, chunk_size))
+
+                    if not len(chunk):
+                        break
+
+                    time_start = time.perf_counter()
+                    cur.executemany(sql, chunk)
+                    self._record(self._conn, sql, chunk[0], time_start, len(chunk))
+                    n_rows += len(chunk)
+
+                self._invalidate(query.table)
+        except sqlite3.Error as e:
+            tired.logging.error(f"Failed to execute query: {sql}: {e}")
+            raise e
+
+        return n_rows
+
+    def delete_ids(self, table, identifiers, chunk_size=500):
+        """
+        Deletes rows w/ the given ids, `chunk_size` ids per statement, in one
+        transaction. `identifiers` may be a generator. Returns the number of
+        deleted rows (not counting cascade deletes).
+        """
+        identifiers = iter(identifiers)
+        n_rows = 0
+
+        with self.transaction():
+            while True:
+                chunk = list(itertools.islice(identifiers, chunk_size))
+
+                if not len(chunk):
+                    break
+
+                query = DeleteQuery(table)
+                query.add_constraint(InPredicate(TableFieldPair(table, table.get_id_field()), chunk))
+                sql, parameters = query.generate_sql_parameterized()
+                time_start = time.perf_counter()
+                n_deleted = self._conn.execute(sql, parameters).rowcount
+                self._record(self._conn, sql, parameters, time_start, n_deleted)
+                n_rows += n_deleted
+
+            self._invalidate(table)
+
+        return n_rows
+
+    def import_rows(self, table, path, data_format=None, chunk_size=10000):
+        """
+        Loads rows from a CSV (w/ a header) or JSONL file into the table.
+        `data_format` is "csv" or "jsonl", deduced from the suffix (see
+        `DATA_FORMATS`) by default. Columns are matched against the table's
+        field names, or their aliases (e.g. "child_quantity"), so files
+        produced by `export_rows` can be loaded back. Values are coerced to
+        `field_type` of the fields.
+
+        The file is read, and the rows are inserted in chunks of `chunk_size`
+        rows, one transaction per chunk, so the memory use does not depend
+        on the size of the file. Returns the number of rows.
+        """
+        data_format = _get_data_format(path, data_format)
+        fields = dict()
+
+        for field in table.get_fields():
+            fields[field.get_name()] = field
+            fields[TableFieldPair(table, field).get_alias()] = field
+
+        time_start = time.perf_counter()
+        n_rows = 0
+
+        with open(path, 'r', encoding="utf-8", newline='') as file:
+            names, rows = _read_records(file, data_format)
+            unknown_names = [i for i in names if i not in fields]
+            assert not len(unknown_names), f'Table "{table.get_name()}" has no fields {unknown_names}'
+            converters = list(map(lambda i: _make_field_converter(fields[i]), names))
+
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+
+                if not len(chunk):
+                    break
+
+                query = BulkInsertQuery(table)
+
+                for name in names:
+                    query.add_field(fields[name])
+
+                query.add_rows(tuple(map(lambda c, v: c(v), converters, row)) for row in chunk)
+                n_rows += self.execute_many(query, chunk_size)
+
+        _log_throughput(f'Import into "{table.get_name()}"', n_rows, time_start)
+
+        return n_rows
+
+    def export_rows(self, query, path, data_format=None, batch_size=1000):
+        """
+        Streams the result of a select query into a CSV (w/ a header of
+        column aliases) or JSONL file, see `import_rows`. NULLs become empty
+        CSV values. Returns the number of rows.
+        """
+        data_format = _get_data_format(path, data_format)
+        names = query.get_row_type()._fields
+        time_start = time.perf_counter()
+        n_rows = 0
+
+        with open(path, 'w', encoding="utf-8", newline='') as file:
+            if data_format == "csv":
+                writer = csv.writer(file)
+                writer.writerow(names)
+
+            for rows in self._iterate_batches(query, batch_size, False):
+                if data_format == "csv":
+                    writer.writerows(rows)
+                else:
+                    file.writelines(json.dumps(dict(zip(names, i)), ensure_ascii=False) + '\n' for i in rows)
+
+                n_rows += len(rows)
+
+        _log_throughput(f'Export to "{path}"', n_rows, time_start)
+
+        return n_rows
+
+    def execute_query(self, query):
+        return self.execute(query)
+
+    def execute_transaction(self, transaction):
+        """
+        Runs queries of a `Transaction` w/ bound parameters, and commits them
+        at once. Returns the list of results, one per query.
+        """
+        with self.transaction():
+            return list(map(self.execute, transaction.get_queries()))
+
+    def _execute_sql(self, sql, parameters=()):
+        """
+        Runs raw SQL on the writer, returns resulting rows
+        """
+        with self._writer_lock:
+            return self._conn.execute(sql, parameters).fetchall()
+
+    def migrate(self, tables=None, chunk_size=10000, pause=0.0):
+        """
+        Brings the schema in line w/ `tables` (the ones passed on
+        construction by default), see `SchemaMigration`
+        """
+        try:
+            SchemaMigration(tables or self._tables, chunk_size, pause).run(self)
+        finally:
+            if self._cache is not None:
+                self._cache.clear()
+
+    def backup(self, target_path, pages_per_step=256, progress=None):
+        """
+        Copies the database into `target_path` w/ SQLite online backup API,
+        `pages_per_step` pages at a time. The writer is only held during a
+        step, so writes from other threads proceed b/w steps. They are made
+        on the same connection, so SQLite carries them over into the copy
+        instead of restarting the backup.
+
+        `progress(n_copied_pages, n_pages)` is called after each step, e.g.
+        `print_backup_progress`.
+        """
+        def yield_writer():
+            self._writer_lock.release()
+
+            try:
+                time.sleep(0)
+            finally:
+                self._writer_lock.acquire()
+
+        target = sqlite3.connect(target_path)
+
+        try:
+            with self._writer_lock:
+                assert self._transaction_depth == 0, "A pending transaction would not get into the copy"
+                self._conn.backup(target, pages=pages_per_step,
+                    progress=_make_backup_progress(progress, yield_writer))
+        finally:
+            target.close()
+
+        tired.logging.info(f'Backed up the database into "{target_path}"')
+
+    def restore(self, source_path, pages_per_step=256, progress=None):
+        """
+        Replaces the contents of the database w/ those of `source_path`, see
+        `backup`. E.g. a read-heavy batch job may load a disk database into
+        an in-memory one:
+
+        ```
+        db.connect(":memory:")
+        db.restore("data.db", progress=tired.sqlite.print_backup_progress)
+        ...
+        db.backup("data.db")  # Writes it back
+        ```
+
+        A WAL database cannot be restored from one w/ a different page size.
+        """
+        source = sqlite3.connect(source_path)
+
+        try:
+            with self._writer_lock:
+                assert self._transaction_depth == 0, "The pending transaction would be overwritten"
+                source.backup(self._conn, pages=pages_per_step, progress=_make_backup_progress(progress))
+        finally:
+            source.close()
+
+        if self._cache is not None:
+            self._cache.clear()
+
+        tired.logging.info(f'Restored the database from "{source_path}"')
+
+    def execute_script(self, script):
+        with self._writer_lock:
+            assert self._transaction_depth == 0, "`executescript` would commit the pending transaction"
+            self._conn.cursor().executescript(script.generate_sql_script())
+
+            if self._cache is not None:
+                self._cache.clear()
+
+    @contextlib.contextmanager
+    def transaction(self, mode="deferred"):
+        """
+        A scope, in which any queries are run on the connection, and then
+        committed at once on exit, or rolled back, if an exception is raised.
+
+        The outermost scope issues `BEGIN <mode>`, where `mode` is one of
+        `TRANSACTION_MODES`. E.g. "immediate" takes the write lock right away,
+        so a write-heavy job does not fail midway on `SQLITE_BUSY`. Nested
+        scopes become savepoints, so a failed nested scope only reverts its
+        own changes (the `mode` is ignored for those).
+
+        The writer connection is held by the calling thread for the whole
+        scope.
+        """
+        assert mode in TRANSACTION_MODES
+
+        with self._writer_lock:
+            cur = self._conn.cursor()
+
+            if self._transaction_depth == 0:
+                begin, commit, rollback = [f"begin {mode}"], ["commit"], ["rollback"]
+            else:
+                savepoint = f"savepoint_{self._transaction_depth}"
+                begin, commit, rollback = [f"savepoint {savepoint}"], [f"release {savepoint}"], \
+                    [f"rollback to {savepoint}", f"release {savepoint}"]
+
+            for sql in begin:
+                cur.execute(sql)
+
+            self._transaction_depth += 1
+            self._transaction_thread = threading.get_ident()
+
+            try:
+                yield self
+
+                for sql in commit:
+                    cur.execute(sql)
+            except BaseException:
+                # A failed commit (e.g. on SQLITE_BUSY) leaves the
+                # transaction open. Errors like SQLITE_FULL, or an interrupt,
+                # roll it back on their own, and "rollback" would fail then,
+                # hiding the actual error
+                self._transaction_depth -= 1
+
+                if self._conn.in_transaction:
+                    for sql in rollback:
+                        cur.execute(sql)
+
+                if self._transaction_depth == 0:
+                    self._pending_invalidations.clear()
+
+                raise
+            else:
+                self._transaction_depth -= 1
+
+                if self._transaction_depth == 0 and len(self._pending_invalidations):
+                    self._invalidate_table_names(list(self._pending_invalidations))
+                    self._pending_invalidations.clear()
+
+    def connect(self, filename, cached_statements=256, n_readers=0, profile=None):
+        """
+        `cached_statements` is the size of the prepared statement cache (per
+        connection).
+
+        `n_readers` is the number of read-only connections for concurrent
+        read queries. When it is non-zero, WAL journal mode is enabled, so
+        readers never wait for the writer.
+
+        `profile` is either a name from `PRAGMA_PROFILES`, or a dict of
+        pragmas. SQLite defaults are used, if it is None.
+        """
+        tired.logging.info(f'Trying to connect w/ the database "{filename}"')
+        # Transactions are managed explicitly, see `transaction()`. Access to
+        # the writer is serialized by `_writer_lock`, so it may be shared
+        # b/w threads
+        self._conn = sqlite3.connect(filename, cached_statements=cached_statements, isolation_level=None,
+            check_same_thread=False)
+
+        if type(profile) is str:
+            pragmas = dict(PRAGMA_PROFILES[profile])
+        else:
+            pragmas = dict(profile or dict())
+
+        if n_readers > 0:
+            assert filename != ":memory:", "In-memory databases cannot be shared b/w connections"
+            pragmas["journal_mode"] = "wal"
+
+        pragmas = _apply_pragmas(self._conn, pragmas)
+        tired.logging.debug(f"pragmas: {pragmas}")
+
+        if n_readers > 0:
+            uri = pathlib.Path(filename).resolve().as_uri() + "?mode=ro"
+            reader_pragmas = {k: v for k, v in pragmas.items() if k in _CONNECTION_PRAGMAS}
+
+            for _ in range(n_readers):
+                reader = sqlite3.connect(uri, uri=True, cached_statements=cached_statements,
+                    isolation_level=None, check_same_thread=False)
+                _apply_pragmas(reader, reader_pragmas)
+                self._readers.put(reader)
+
+        self._n_readers = n_readers
+
+    def close(self):
+        with self._writer_lock:
+            for _ in range(self._n_readers):
+                self._readers.get().close()
+
+            self._n_readers = 0
+            self._conn.close()
+
+
+@dataclasses.dataclass
+class MigrationStep:
+    table: object
+
+    action: str
+    """
+    "create", "add_columns", "create_indices", or "rebuild"
+    """
+
+    sql: list
+    """
+    Statements to run, for all the actions but "rebuild"
+    """
+
+    copied_field_names: list = None
+    """
+    Fields kept by a "rebuild"
+    """
+
+
+class SchemaMigration:
+    """
+    Diffs declared tables against the database schema, and brings the latter
+    in line:
+
+    - missing tables are created;
+    - new regular fields (`InfoField`) are added w/ "alter table";
+    - other changes (removed fields, changed types, new foreign keys) are
+      applied by rebuilding the table: a copy w/ the new schema is filled in
+      chunks of `chunk_size` rows, each in its own short transaction, w/
+      `pause` seconds b/w them. Triggers mirror concurrent writes into the
+      copy. In the end, the copy replaces the table in one transaction. The
+      table stays readable and writable throughout;
+    - missing indices are created.
+
+    Fields are matched by name. A rebuild fails and is rolled back, if a new
+    field w/o a default (e.g. `ForeignIdField`) is added to a non-empty
+    table.
+    """
+
+    def __init__(self, tables, chunk_size=10000, pause=0.0):
+        self._tables = tables
+        self._chunk_size = chunk_size
+        self._pause = pause
+
+    def _generate_table_plan_iter(self, db, table):
+        name = table.get_name()
+        columns = {i[1]: i[2].lower() for i in db._execute_sql(f"pragma table_info({name})")}
+
+        if not len(columns):
+            yield MigrationStep(table, "create", [table.generate_sql_create()])
+            indices = list(table._generate_indices_iter())
+        else:
+            step = self._make_table_alter_step(table, columns)
+
+            if step is not None:
+                yield step
+
+            if step is not None and step.action == "rebuild":
+                indices = []  # Rebuilding recreates them
+            else:
+                index_names = set(map(lambda i: i[0], db._execute_sql(
+                    "select name from sqlite_master where type = 'index' and tbl_name = ?", (name,))))
+                indices = [i for i in table._generate_indices_iter() if i.get_name(table) not in index_names]
+
+        if len(indices):
+            yield MigrationStep(table, "create_indices", [i.generate_sql_create(table) for i in indices])
+
+    def _make_table_alter_step(self, table, columns):
+        name = table.get_name()
+        fields = table.get_fields()
+        field_names = list(map(lambda i: i.get_name(), fields))
+        new_fields = [i for i in fields if i.get_name() not in columns]
+        is_rebuild_required = any(map(lambda i: i not in field_names, columns)) \
+            or any(map(lambda i: i.get_name() in columns and columns[i.get_name()] != i.field_type_as_name(), fields)) \
+            or any(map(lambda i: type(i) is not InfoField, new_fields))
+
+        if is_rebuild_required:
+            return MigrationStep(table, "rebuild", [], [i for i in field_names if i in columns])
+        elif len(new_fields):
+            return MigrationStep(table, "add_columns",
+                [f'alter table {name} add column {i.generate_sql_create()}' for i in new_fields])
+
+        return None
+
+    def generate_plan(self, db):
+        """
+        Returns a list of `MigrationStep`, empty, if the schema is up to date
+        """
+        return [step for table in self._tables for step in self._generate_table_plan_iter(db, table)]
+
+    def run(self, db):
+        for step in self.generate_plan(db):
+            tired.logging.info(f'Migrating table "{step.table.get_name()}": {step.action}')
+
+            if step.action == "rebuild":
+                self._rebuild(db, step)
+            else:
+                with db.transaction("immediate"):
+                    for sql in filter(len, step.sql):
+                        db._execute_sql(sql)
+
+    def _rebuild(self, db, step):
+        name = step.table.get_name()
+        copy_name = name + "__migration"
+        columns = ', '.join(step.copied_field_names)
+        trigger_names = [f'{copy_name}_{i}' for i in ["insert", "update", "delete"]]
+        mirror = f"insert or replace into {copy_name} ({columns}) values " \
+            f"({', '.join(map(lambda i: 'new.' + i, step.copied_field_names))})"
+        copy = f"insert or replace into {copy_name} ({columns}) select {columns} from {name}"
+
+        with db.transaction("immediate"):
+            db._execute_sql(f"drop table if exists {copy_name}")  # Leftover of an interrupted migration
+            db._execute_sql(step.table.generate_sql_create(copy_name))
+            db._execute_sql(f"create trigger {trigger_names[0]} after insert on {name} begin {mirror}; end")
+            db._execute_sql(f"create trigger {trigger_names[1]} after update on {name} begin {mirror}; end")
+            db._execute_sql(f"create trigger {trigger_names[2]} after delete on {name} begin "
+                f"delete from {copy_name} where id = old.id; end")
+
+        try:
+            after_id = db._execute_sql(f"select min(id) - 1 from {name}")[0][0]
+            n_rows = 0
+
+            while after_id is not None:
+                with db.transaction("immediate"):
+                    # The last id of the chunk
+                    last_id = db._execute_sql(f"select id from {name} where id > ? order by id limit 1 offset ?",
+                        (after_id, self._chunk_size - 1))
+
+                    if not len(last_id):
+                        break
+
+                    db._execute_sql(f"{copy} where id > ? and id <= ?", (after_id, last_id[0][0]))
+
+                after_id = last_id[0][0]
+                n_rows += self._chunk_size
+                tired.logging.debug(f'Copied {n_rows} rows of "{name}"')
+                time.sleep(self._pause)
+
+            # Dropping a parent table w/ foreign keys enabled would cascade
+            # deletes into children. The pragma is a no-op inside a
+            # transaction, and other threads must not write meanwhile
+            with db._writer_lock:
+                foreign_keys = db._execute_sql("pragma foreign_keys")[0][0]
+                db._execute_sql("pragma foreign_keys = OFF")
+
+                try:
+                    with db.transaction("immediate"):
+                        if after_id is not None:
+                            db._execute_sql(f"{copy} where id > ?", (after_id,))
+
+                        for trigger_name in trigger_names:
+                            db._execute_sql(f"drop trigger {trigger_name}")
+
+                        db._execute_sql(f"drop table {name}")
+                        db._execute_sql(f"alter table {copy_name} rename to {name}")
+
+                        for sql in filter(len, step.table.generate_sql_create_indices().split('\n')):
+                            db._execute_sql(sql)
+
+                        if len(db._execute_sql(f"pragma foreign_key_check({name})")):
+                            raise sqlite3.IntegrityError(f'Rebuilt table "{name}" violates foreign keys')
+                finally:
+                    db._execute_sql(f"pragma foreign_keys = {foreign_keys}")
+        except BaseException:
+            with db.transaction():
+                for trigger_name in trigger_names:
+                    db._execute_sql(f"drop trigger if exists {trigger_name}")
+
+                db._execute_sql(f"drop table if exists {copy_name}")
+
+            raise
+
+
+@dataclasses.dataclass
+class _AsyncDbJob:
+    function: object
+    is_write: bool
+    future: object
+
+
+def _set_future_result(future, result, error):
+    if future.cancelled():
+        return
+
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class AsyncDb:
+    """
+    asyncio front-end for `Db`, accepting the same query objects. The
+    connection is owned by a dedicated worker thread, so the event loop
+    never waits for SQLite.
+
+    Writes that pile up in the submission queue while the worker is busy are
+    merged into one transaction (group commit), which pays the fsync cost
+    once per group. Each write runs in its own savepoint, so a failing query
+    only fails its own caller. Queries are run in the order of submission,
+    so a read sees all the writes submitted before it.
+
+    When connected w/ `n_readers > 0`, read queries are run on separate
+    threads w/ pooled reader connections (see `Db`), and do not queue behind
+    writes. They see writes that have been awaited.
+    """
+
+    def __init__(self, tables: list = None, max_group_size=256):
+        self._db = Db(tables)
+        self._jobs = queue.Queue()
+        self._max_group_size = max_group_size
+        self._thread = None
+        self._read_executor = None
+
+    def _submit(self, function, is_write):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._jobs.put(_AsyncDbJob(function, is_write, future))
+
+        return future
+
+    def _submit_read(self, function):
+        if self._read_executor is None:
+            return self._submit(function, False)
+
+        return asyncio.get_running_loop().run_in_executor(self._read_executor, function)
+
+    def _resolve(self, job, result, error):
+        job.future.get_loop().call_soon_threadsafe(_set_future_result, job.future, result, error)
+
+    def _run_job(self, job):
+        try:
+            self._resolve(job, job.function(), None)
+        except Exception as e:
+            self._resolve(job, None, e)
+
+    def _run_group(self, group):
+        results = list()
+
+        try:
+            with self._db.transaction("immediate"):
+                for job in group:
+                    try:
+                        with self._db.transaction():
+                            results.append((job, job.function(), None))
+                    except Exception as e:
+                        results.append((job, None, e))
+        except Exception as e:
+            # "begin", or "commit" has failed. `transaction()` has rolled
+            # back, so nothing has been written, and the next group starts
+            # afresh
+            results = [(job, None, e) for job in group]
+
+        for job, result, error in results:
+            self._resolve(job, result, error)
+
+    def _run(self):
+        """
+        Worker thread. `None` job stops it
+        """
+        pending = list()
+
+        while True:
+            job = pending.pop() if len(pending) else self._jobs.get()
+
+            if job is None:
+                break
+            elif not job.is_write:
+                self._run_job(job)
+
+                continue
+
+            # Merge writes, stop at the first other job to keep the order
+            group = [job]
+
+            while len(group) < self._max_group_size:
+                try:
+                    job = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+
+                if job is not None and job.is_write:
+                    group.append(job)
+                else:
+                    pending.append(job)
+
+                    break
+
+            self._run_group(group)
+
+    async def connect(self, filename, n_readers=0, **kwargs):
+        """
+        See `Db.connect`
+        """
+        self._thread = threading.Thread(target=self._run, name="AsyncDb", daemon=True)
+        self._thread.start()
+        await self._submit(lambda: self._db.connect(filename, n_readers=n_readers, **kwargs), False)
+
+        if n_readers > 0:
+            self._read_executor = concurrent.futures.ThreadPoolExecutor(n_readers, thread_name_prefix="AsyncDb")
+
+    async def execute(self, query, mapped=False):
+        if _is_read_query(query):
+            return await self._submit_read(lambda: self._db.execute(query, mapped))
+
+        return await self._submit(lambda: self._db.execute(query, mapped), True)
+
+    async def execute_many(self, query, chunk_size=1000):
+        return await self._submit(lambda: self._db.execute_many(query, chunk_size), True)
+
+    async def delete_ids(self, table, identifiers, chunk_size=500):
+        return await self._submit(lambda: self._db.delete_ids(table, identifiers, chunk_size), True)
+
+    async def execute_transaction(self, transaction):
+        return await self._submit(lambda: self._db.execute_transaction(transaction), True)
+
+    async def execute_script(self, script):
+        return await self._submit(lambda: self._db.execute_script(script), False)
+
+    async def iterate(self, query, batch_size=1000, mapped=False):
+        """
+        Async generator over resulting rows, fetched `batch_size` rows at a
+        time (see `Db.iterate`). When leaving the loop early, close the
+        generator, so the connection is released right away:
+
+            rows = db.iterate(query)
+
+            try:
+                async for row in rows:
+                    ...
+            finally:
+                await rows.aclose()
+        """
+        rows = await self._submit_read(lambda: self._db.iterate(query, batch_size, mapped))
+
+        try:
+            while True:
+                batch = await self._submit_read(lambda: list(itertools.islice(rows, batch_size)))
+
+                if not len(batch):
+                    break
+
+                for row in batch:
+                    yield row
+        finally:
+            await self._submit_read(rows.close)
+
+    async def close(self):
+        await self._submit(self._db.close, False)
+        self._jobs.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+
+        if self._read_executor is not None:
+            self._read_executor.shutdown()
+
+
+def test_schema_migration_rebuild():
+    import random
+
+    quantity = InfoField("quantity", int)
+    name_field = InfoField("name", str)
+    legacy = InfoField("legacy", str)
+    old_table = Table("item")
+
+    for field in [quantity, name_field, legacy]:
+        old_table.add_field(field)
+
+    generate_db = GenerateDbScript()
+    generate_db.add_table(old_table)
+    db = Db([old_table])
+    db.connect(":memory:")
+    db.execute_script(generate_db)
+    insert = BulkInsertQuery(old_table)
+
+    for field in [quantity, name_field, legacy]:
+        insert.add_field(field)
+
+    insert.add_rows((i, f"item {i}", "legacy") for i in range(500))
+    db.execute_many(insert)
+    expected = {i + 1: (i, f"item {i}") for i in range(500)}
+    is_migrated = threading.Event()
+    errors = list()
+
+    def write():
+        random.seed(0)
+
+        while not is_migrated.is_set():
+            try:
+                write_one()
+            except Exception as e:
+                errors.append(e)
+
+                return
+
+            time.sleep(0.0001)
+
+    def write_one():
+        # The writes are valid for both schemas, as "legacy" may be dropped
+        # before `is_migrated` is set
+        with db.transaction():
+            action = random.choice(["insert", "update", "delete"])
+            identifier = random.choice(list(expected))
+
+            if action == "insert":
+                query = InsertQuery(old_table)
+                query.add_value(quantity, -1)
+                query.add_value(name_field, "inserted")
+                db.execute(query)
+                expected[db._execute_sql("select last_insert_rowid()")[0][0]] = (-1, "inserted")
+            elif action == "update":
+                query = UpdateQuery(old_table)
+                query.add_field(quantity, expected[identifier][0] + 1000)
+                query.add_eq_constraint(old_table.get_id_field(), identifier)
+                db.execute(query)
+                expected[identifier] = (expected[identifier][0] + 1000, expected[identifier][1])
+            else:
+                db.execute(DeleteQuery(old_table, identifier))
+                del expected[identifier]
+
+    # "legacy" is dropped, so the table gets rebuilt
+    new_table = Table("item")
+    new_table.add_field(quantity)
+    new_table.add_field(name_field)
+    thread = threading.Thread(target=write)
+    thread.start()
+
+    try:
+        plan = SchemaMigration([new_table]).generate_plan(db)
+        assert [i.action for i in plan] == ["rebuild"]
+        db.migrate([new_table], chunk_size=20, pause=0.001)
+    finally:
+        is_migrated.set()
+        thread.join()
+
+    assert not len(errors), errors
+    assert [i[1] for i in db._execute_sql("pragma table_info(item)")] == ["id", "quantity", "name"]
+    assert not len(db._execute_sql("select name from sqlite_master where name like 'item__migration%'"))
+    assert {i[0]: (i[1], i[2]) for i in db._execute_sql("select id, quantity, name from item")} == expected
+    db.close()
+
+
+def test_transaction_rollback():
+    import tempfile
+
+    quantity = InfoField("quantity", int)
+    table = Table("item")
+    table.add_field(quantity)
+    generate_db = GenerateDbScript()
+    generate_db.add_table(table)
+
+    def insert(value):
+        query = InsertQuery(table)
+        query.add_value(quantity, value)
+        db.execute(query)
+
+    def select_quantities():
+        return [i[0] for i in db._execute_sql("select quantity from item order by id")]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.db")
+        db = Db([table])
+        db.connect(path, profile={"busy_timeout": 100})
+        db.execute_script(generate_db)
+
+        # A failed nested scope only reverts its own changes
+        with db.transaction():
+            insert(1)
+
+            try:
+                with db.transaction():
+                    insert(2)
+
+                    raise ValueError
+            except ValueError:
+                pass
+
+            insert(3)
+
+        assert select_quantities() == [1, 3]
+
+        # An open read keeps the commit from taking the write lock
+        reader = sqlite3.connect(path, isolation_level=None)
+        reader.execute("begin")
+        reader.execute("select * from item").fetchall()
+
+        try:
+            with db.transaction():
+                insert(4)
+        except sqlite3.OperationalError:
+            pass
+        else:
+            assert False, "The commit is expected to fail"
+
+        reader.execute("rollback")
+        reader.close()
+        assert not db._conn.in_transaction
+
+        with db.transaction():
+            insert(5)
+
+        insert(6)
+        assert select_quantities() == [1, 3, 5, 6]
+        db.close()
+
+
+def test_iterate_releases_writer():
+    quantity = InfoField("quantity", int)
+    table = Table("item")
+    table.add_field(quantity)
+    generate_db = GenerateDbScript()
+    generate_db.add_table(table)
+    db = Db([table])
+    db.connect(":memory:")
+    db.execute_script(generate_db)
+    insert = BulkInsertQuery(table)
+    insert.add_field(quantity)
+    insert.add_rows((i,) for i in range(100))
+    db.execute_many(insert)
+    query = InnerJoinSelectQuery(table)
+    query.add_field(quantity)
+    rows = db.iterate(query, batch_size=10)
+    assert next(rows) == (0,)
+
+    # Neither a write, nor closing the generator from another thread waits
+    # for the suspended generator
+    def write():
+        query = InsertQuery(table)
+        query.add_value(quantity, -1)
+        db.execute(query)
+        rows.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(db.execute(query)) == 101
+    db.close()
+
+
+def test_str_column_to_numpy():
+    try:
+        import numpy
+    except ImportError:
+        print("NumPy is not installed, skipping")
+
+        return
+
+    strings = ["", "item", "ítem 1", "\U0001f600 €", "", "abc" * 3]
+
+    for values in [strings, strings[:1], ["ascii", "only"], []]:
+        column = StrColumn()
+
+        for i in range(0, len(values), 2):
+            column.extend(values[i:i + 2])
+
+        array = column.to_numpy()
+        assert array.dtype == numpy.array(values, dtype=str).dtype
+        assert (array == numpy.array(column.to_list(), dtype=str)).all()
+
+    # One long string among short ones
+    column = StrColumn()
+    column.extend(["a"] * 100 + ["ц" * 1000])
+    array = column.to_numpy()
+    assert array.dtype == object and array.tolist() == column.to_list()